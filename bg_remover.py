@@ -1,112 +1,2587 @@
 import os
 import argparse
+import platform
 from pathlib import Path
+from collections import OrderedDict, deque
 import concurrent.futures
-from tqdm import tqdm
-import rembg
-from PIL import Image
-import numpy as np
+import contextlib
+import fnmatch
+import functools
+import hashlib
+import io
+import json
+import math
+import shutil
+import socket
+import struct
+import sys
+import tarfile
+import tempfile
+import itertools
+import queue
+import re
+import threading
+import time
+import zipfile
+import zlib
+import importlib
+
+class _LazyModule:
+    """Stand-in for a module that is only imported on first attribute access.
+    
+    Importing rembg pulls in onnxruntime, scipy and numba, which dominates
+    startup; --help, argument errors and empty runs never need it.
+    """
+    
+    def __init__(self, name):
+        self._lazy_name = name
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        # Copy the namespace so later lookups skip __getattr__ entirely
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+rembg = _LazyModule("rembg")
+rembg_bg = _LazyModule("rembg.bg")
+tqdm = _LazyModule("tqdm")
+Image = _LazyModule("PIL.Image")
+ImageOps = _LazyModule("PIL.ImageOps")
+np = _LazyModule("numpy")
+ort = _LazyModule("onnxruntime")
+asyncio = _LazyModule("asyncio")
+
+def _import_runtime():
+    """Import rembg on the calling thread before any worker threads use it.
+    
+    pymatting, which rembg imports, hangs interpreter exit when its numba
+    layer is first initialized from a worker thread.
+    """
+    rembg_bg.naive_cutout
+
+# Preprocessing rembg applies for each supported model: (mean, std, input size)
+_DEFAULT_INPUT_SPEC = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+_MODEL_INPUT_SPECS = {
+    "u2net": _DEFAULT_INPUT_SPEC,
+    "u2netp": _DEFAULT_INPUT_SPEC,
+    "u2net_human_seg": _DEFAULT_INPUT_SPEC,
+    "silueta": _DEFAULT_INPUT_SPEC,
+}
+
+# Default processing settings; every option that changes the output
+# belongs here so it becomes part of the result cache key
+_PROCESSING_DEFAULTS = {
+    "fast": False,
+    "alpha_matting": False,
+    "alpha_matting_foreground_threshold": 240,
+    "alpha_matting_background_threshold": 10,
+    "alpha_matting_erode_size": 10,
+    "matting": "pymatting",
+    "max_pixels": None,
+    "output_format": None,
+    "png_compress_level": 6,
+    "webp_quality": 90,
+    "webp_lossless": False,
+    "crop": False,
+}
+
+# File extension written for each output format; None keeps PNG for generated names
+_OUTPUT_EXTENSIONS = {None: ".png", "png": ".png", "mask": ".png", "webp": ".webp"}
+
+# Approximate resident size of each model, used for the session registry byte cap
+_MODEL_BYTES = {
+    "u2net": 176 * 1024 ** 2,
+    "u2netp": 5 * 1024 ** 2,
+    "u2net_human_seg": 176 * 1024 ** 2,
+    "silueta": 43 * 1024 ** 2,
+}
+
+class ResultCache:
+    """On-disk LRU cache of encoded results keyed by input bytes, model and settings."""
+    
+    def __init__(self, cache_dir, max_bytes=1024 ** 3, shared=False):
+        """Open (or create) a cache directory holding at most max_bytes of results.
+        
+        shared marks a cache that other processes write to at the same time;
+        it re-reads the directory every second, or after storing 1/16 of
+        max_bytes, so the size cap covers every writer (each can overshoot
+        it by about that much between rescans).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+    
+    def __reduce__(self):
+        # Worker processes reopen the same directory instead of sharing the lock
+        return (ResultCache, (str(self.cache_dir), self.max_bytes, True))
+    
+    def key(self, data, model_name, params):
+        """Build the cache key for input bytes processed with a model and settings."""
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps([model_name, params], sort_keys=True).encode())
+        return digest.hexdigest()
+    
+    def fetch(self, key, output_path):
+        """Copy a cached result to output_path; returns False on a miss."""
+        name = f"{key}.cache"
+        path = self.cache_dir / name
+        try:
+            shutil.copyfile(path, output_path)
+            # Refresh the entry's position for LRU eviction in later runs
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(name)
+            return False
+        
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+        return True
+    
+    def store(self, key, result_path):
+        """Add a written result to the cache, evicting the least recently used entries."""
+        name = f"{key}.cache"
+        path = self.cache_dir / name
+        tmp_path = self.cache_dir / f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Write to a temporary file first so readers never see partial entries
+            shutil.copyfile(result_path, tmp_path)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            # A failed cache write must never fail the image itself
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            return
+        
+        with self._lock:
+            self._stored_since_scan += size
+            if self.shared and (time.monotonic() - self._scanned_at >= 1.0
+                                or self._stored_since_scan >= self.max_bytes // 16):
+                # Other processes' entries count toward the cap too
+                self._scan()
+            self._forget(name)
+            self._entries[name] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest, _ = next(iter(self._entries.items()))
+                self._forget(oldest)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.cache_dir / oldest)
+    
+    def _scan(self):
+        """Index the entries in the directory from least to most recently used."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".cache"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process while scanning
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._total_bytes = sum(self._entries.values())
+        self._scanned_at = time.monotonic()
+        self._stored_since_scan = 0
+    
+    def _forget(self, name):
+        """Drop an entry from the index (the lock must be held)."""
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+class Manifest:
+    """Append-only JSON Lines log of processed inputs, used to resume interrupted runs."""
+    
+    def __init__(self, path):
+        """Load the entries already recorded at path, if any."""
+        self.path = Path(path)
+        self.entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+        # Inputs are re-read and hashed on these threads, never the caller's
+        self._hasher = None
+        self._error = None
+        
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A job killed mid-write leaves at most one truncated line
+                        continue
+                    self.entries[entry["input"]] = entry
+    
+    def is_done(self, input_path, output_path, model_name, params):
+        """Return True if input_path was already processed into a still-valid output."""
+        entry = self.entries.get(input_path)
+        if (entry is None or not entry["success"] or entry["output"] != output_path
+                or entry["model"] != model_name or entry["params"] != params):
+            return False
+        
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            return False
+        if not os.path.exists(output_path) or stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime == entry["mtime"]:
+            return True
+        # Touched but possibly unchanged: fall back to comparing content
+        return _file_sha256(input_path) == entry["sha256"]
+    
+    def record(self, input_path, output_path, model_name, params, success, error=None):
+        """Queue the outcome for one input; it is hashed and appended on a background thread.
+        
+        Hashing means reading the whole input again, which on network
+        storage would otherwise hold up the thread dispatching new work.
+        """
+        with self._lock:
+            if self._hasher is None:
+                self._hasher = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix="manifest"
+                )
+            hasher = self._hasher
+        hasher.submit(self._append, input_path, output_path, model_name, params, success, error)
+    
+    def _append(self, input_path, output_path, model_name, params, success, error=None):
+        """Hash one input, then append its entry and flush it to disk immediately."""
+        try:
+            self._write_entry(input_path, output_path, model_name, params, success, error)
+        except Exception as e:
+            # Reported by close(), since nobody waits on this thread
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+    
+    def _write_entry(self, input_path, output_path, model_name, params, success, error=None):
+        """Build the entry for one input and append it."""
+        try:
+            stat = os.stat(input_path)
+            size, mtime, digest = stat.st_size, stat.st_mtime, _file_sha256(input_path)
+        except OSError:
+            # Inputs that vanished are still logged as failures
+            size = mtime = digest = None
+        entry = {
+            "input": input_path,
+            "size": size,
+            "mtime": mtime,
+            "sha256": digest,
+            "model": model_name,
+            "params": params,
+            "output": output_path,
+            "success": success,
+        }
+        if error is not None:
+            entry["error"] = error
+        line = json.dumps(entry) + "\n"
+        
+        with self._lock:
+            if self._file is None:
+                self._open_for_append()
+            self._file.write(line)
+            # Flushing per entry means a killed job loses at most the images in flight
+            self._file.flush()
+            self.entries[input_path] = entry
+    
+    def close(self):
+        """Finish the queued entries, then sync and close the manifest file."""
+        with self._lock:
+            hasher, self._hasher = self._hasher, None
+        if hasher is not None:
+            hasher.shutdown(wait=True)
+        
+        with self._lock:
+            error, self._error = self._error, None
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        if error is not None:
+            raise error
+    
+    def _open_for_append(self):
+        """Open the manifest for appending, terminating a truncated last line."""
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._file = open(self.path, "a+", encoding="utf-8")
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+class ShardWriter:
+    """Append results to rolling tar shards capped by size or member count.
+    
+    Each finished shard gets its lines in <prefix>-index.jsonl, mapping the
+    input to the shard, member name and byte offset of the member's data,
+    so single results can be read back with one seek.
+    """
+    
+    def __init__(self, prefix, max_bytes=1024 ** 3, max_count=10000):
+        """Write shards named <prefix>-00000.tar, <prefix>-00001.tar, ..."""
+        self.prefix = str(prefix)
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.shard_count = 0
+        self.member_count = 0
+        self._tar = None
+        self._entries = []
+        os.makedirs(os.path.dirname(os.path.abspath(self.prefix)), exist_ok=True)
+        self.index_path = f"{self.prefix}-index.jsonl"
+        self._index = open(self.index_path, "w", encoding="utf-8")
+    
+    def add(self, input_name, member_name, data):
+        """Append one encoded result, starting a new shard when the current one is full."""
+        if self._tar is not None and (
+            (self.max_count is not None and len(self._entries) >= self.max_count)
+            or self._tar.offset + len(data) > self.max_bytes
+        ):
+            self._finish_shard()
+        if self._tar is None:
+            self._start_shard()
+        
+        info = tarfile.TarInfo(member_name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+        # The data ends the member, padded to a whole number of 512-byte blocks
+        offset = self._tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self._entries.append({
+            "input": input_name,
+            "shard": os.path.basename(self._path),
+            "member": member_name,
+            "offset": offset,
+            "size": len(data),
+        })
+        self.member_count += 1
+    
+    def close(self):
+        """Finish the last shard and the index."""
+        if self._tar is not None:
+            self._finish_shard()
+        self._index.close()
+    
+    def _start_shard(self):
+        """Open the next shard under a temporary name."""
+        self._path = f"{self.prefix}-{self.shard_count:05d}.tar"
+        self._tar = tarfile.open(f"{self._path}.tmp", "w", format=tarfile.GNU_FORMAT)
+    
+    def _finish_shard(self):
+        """Publish the current shard and its index lines; readers never see partial shards."""
+        self._tar.close()
+        os.replace(f"{self._path}.tmp", self._path)
+        for entry in self._entries:
+            self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+        self._tar = None
+        self._entries = []
+        self.shard_count += 1
+
+class DuplicateIndex:
+    """Groups a run's inputs by exact content and, optionally, by perceptual hash.
+    
+    The first input of a group is its representative and runs through the
+    model. Exact duplicates get a copy of its output; perceptual duplicates
+    (resized or re-encoded copies) reuse its model-resolution mask, scaled
+    to their own size. Only the most recent exact_window representatives
+    are candidates for exact matches, and the most recent window for
+    perceptual ones.
+    """
+    
+    def __init__(self, perceptual=False, max_distance=2, window=128, exact_window=16384,
+                 hash_workers=4):
+        """Match perceptual hashes differing in at most max_distance of their 64 bits."""
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self.window = window
+        self.exact_window = exact_window
+        self.hash_workers = hash_workers
+        self.exact_count = 0
+        self.perceptual_count = 0
+        self.released = []
+        self._lock = threading.Lock()
+        self._digests = OrderedDict()
+        self._exact_representatives = set()
+        self._hashes = OrderedDict()
+        self._preds = OrderedDict()
+        # Results of finished representatives that can still be matched
+        self._results = {}
+        self._waiting = {}
+    
+    def iter_fingerprinted(self, jobs):
+        """Yield (job, fingerprint future) pairs in order, hashing ahead on a thread pool.
+        
+        Reading and decoding inputs for their hashes happens off the
+        dispatching thread; at most a few batches are hashed ahead.
+        """
+        lookahead = 4 * self.hash_workers
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.hash_workers,
+                                                     thread_name_prefix="bg-remover-hash")
+        ahead = deque()
+        try:
+            for job in jobs:
+                ahead.append((job, pool.submit(self._fingerprint, job[0])))
+                if len(ahead) >= lookahead:
+                    yield ahead.popleft()
+            while ahead:
+                yield ahead.popleft()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def hold(self, job, fingerprint=None):
+        """Return True and hold the (input, output) job back if it duplicates an earlier input.
+        
+        fingerprint is a future from iter_fingerprinted; without it the
+        input is hashed on the calling thread.
+        """
+        input_path = job[0]
+        try:
+            if fingerprint is None:
+                fingerprint = self._fingerprint(input_path)
+            else:
+                fingerprint = fingerprint.result()
+            kind, representative = self._match(input_path, *fingerprint)
+        except Exception:
+            # Unreadable inputs are processed normally so the worker reports the error
+            return False
+        if representative is None:
+            return False
+        
+        if representative in self._results:
+            self.released.append((job, kind, representative, self._results[representative]))
+        else:
+            self._waiting.setdefault(representative, []).append((job, kind))
+        return True
+    
+    def finish(self, record):
+        """Note a finished input and release the duplicates waiting for it."""
+        input_path = record["input"]
+        outcome = (record["success"], record["result"])
+        for job, kind in self._waiting.pop(input_path, []):
+            self.released.append((job, kind, input_path, outcome))
+        # Later inputs can only match representatives still in a window
+        if self._matchable(input_path):
+            self._results[input_path] = outcome
+    
+    def remember(self, input_path, pred):
+        """Keep an input's raw model output for perceptual duplicates; called from workers."""
+        if not self.perceptual:
+            return
+        with self._lock:
+            self._preds[input_path] = pred
+            self._preds.move_to_end(input_path)
+            while len(self._preds) > self.window:
+                self._preds.popitem(last=False)
+    
+    def pred(self, input_path):
+        """The remembered raw model output of an input, or None if it is gone."""
+        with self._lock:
+            return self._preds.get(input_path)
+    
+    def stats(self):
+        """Return the number of inferences saved by each kind of match."""
+        return {
+            "inferences_saved": self.exact_count + self.perceptual_count,
+            "exact": self.exact_count,
+            "perceptual": self.perceptual_count,
+        }
+    
+    def _fingerprint(self, input_path):
+        """Content digest and, when matching perceptually, (dHash, aspect ratio) of an input."""
+        digest = _file_sha256(input_path)
+        return digest, _dhash(input_path) if self.perceptual else None
+    
+    def _match(self, input_path, digest, perceptual_hash):
+        """Classify an input as ("exact" or "perceptual", representative) or (None, None)."""
+        representative = self._digests.get(digest)
+        if representative is not None:
+            self._digests.move_to_end(digest)
+            return "exact", representative
+        self._digests[digest] = input_path
+        self._exact_representatives.add(input_path)
+        while len(self._digests) > self.exact_window:
+            evicted = self._digests.popitem(last=False)[1]
+            self._exact_representatives.discard(evicted)
+            self._forget(evicted)
+        
+        if not self.perceptual:
+            return None, None
+        dhash, aspect = perceptual_hash
+        representative = self._nearest(dhash, aspect)
+        if representative is not None:
+            return "perceptual", representative
+        
+        self._hashes[input_path] = (dhash, aspect)
+        while len(self._hashes) > self.window:
+            self._forget(self._hashes.popitem(last=False)[0])
+        return None, None
+    
+    def _matchable(self, input_path):
+        """Whether a later input can still match input_path as its representative."""
+        return input_path in self._exact_representatives or input_path in self._hashes
+    
+    def _forget(self, input_path):
+        """Drop the result of a representative that left both windows."""
+        if not self._matchable(input_path):
+            self._results.pop(input_path, None)
+    
+    def _nearest(self, dhash, aspect):
+        """Closest recent representative within max_distance bits and the same aspect ratio."""
+        if not self._hashes:
+            return None
+        names = list(self._hashes)
+        hashes = np.array([value for value, _ in self._hashes.values()], dtype=np.uint64)
+        aspects = np.array([ratio for _, ratio in self._hashes.values()])
+        
+        # Hamming distance of all candidates at once
+        differing = np.unpackbits((hashes ^ np.uint64(dhash)).view(np.uint8).reshape(-1, 8), axis=1)
+        distances = differing.sum(axis=1)
+        # A mask cannot be rescaled onto a different shape
+        matches = (distances <= self.max_distance) & (np.abs(aspects / aspect - 1) < 0.01)
+        if not matches.any():
+            return None
+        return names[int(np.argmin(np.where(matches, distances, 65)))]
+
+class SessionRegistry:
+    """Thread-safe LRU cache of loaded rembg sessions shared across removers.
+    
+    Sessions are keyed on the model and its ONNX Runtime thread counts, so
+    removers tuned differently never share a session.
+    """
+    
+    def __init__(self, max_models=4, max_bytes=None, loader=None):
+        """Keep at most max_models sessions (and max_bytes of models) resident."""
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        # One lock per model so a slow load never blocks hits on other models
+        self._load_locks = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "load_seconds": 0.0}
+    
+    def get(self, model_name, intra_op_threads=None, inter_op_threads=None):
+        """Return the session for model_name, loading it on a miss.
+        
+        Thread counts of None leave the choice to ONNX Runtime (all cores).
+        """
+        key = (model_name, intra_op_threads, inter_op_threads)
+        with self._lock:
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._sessions[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        
+        with load_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                if key in self._sessions:
+                    self._sessions.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return self._sessions[key]
+            
+            start = time.perf_counter()
+            if self._loader is not None:
+                session = self._loader(model_name)
+            else:
+                session = rembg.new_session(
+                    model_name=model_name,
+                    sess_opts=_session_options(intra_op_threads, inter_op_threads)
+                )
+            elapsed = time.perf_counter() - start
+            
+            with self._lock:
+                self._stats["misses"] += 1
+                self._stats["load_seconds"] += elapsed
+                self._sessions[key] = session
+                self._evict()
+            return session
+    
+    def is_loaded(self, model_name, intra_op_threads=None, inter_op_threads=None):
+        """Return whether model_name is resident, without touching its LRU position."""
+        with self._lock:
+            return (model_name, intra_op_threads, inter_op_threads) in self._sessions
+    
+    def stats(self):
+        """Return hit, miss, eviction and load-time counters plus the resident models."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["resident"] = [_session_label(*key) for key in self._sessions]
+            stats["resident_bytes"] = sum(_model_bytes(key[0]) for key in self._sessions)
+        return stats
+    
+    def clear(self):
+        """Drop every resident session."""
+        with self._lock:
+            self._sessions.clear()
+    
+    def _evict(self):
+        """Drop least recently used sessions until within limits, keeping the newest."""
+        while len(self._sessions) > 1:
+            over_count = self.max_models is not None and len(self._sessions) > self.max_models
+            over_bytes = (
+                self.max_bytes is not None
+                and sum(_model_bytes(key[0]) for key in self._sessions) > self.max_bytes
+            )
+            if not (over_count or over_bytes):
+                break
+            # Removers in the middle of a run keep their reference until they finish
+            self._sessions.popitem(last=False)
+            self._stats["evictions"] += 1
+
+_session_registry = None
+_session_registry_lock = threading.Lock()
+
+def get_session_registry():
+    """Return the process-wide SessionRegistry, creating it on first use."""
+    global _session_registry
+    with _session_registry_lock:
+        if _session_registry is None:
+            _session_registry = SessionRegistry()
+        return _session_registry
+
+def _session_options(intra_op_threads=None, inter_op_threads=None):
+    """ONNX Runtime session options with explicit thread counts, or None for the defaults."""
+    if intra_op_threads is None and inter_op_threads is None:
+        return None
+    sess_opts = ort.SessionOptions()
+    if intra_op_threads is not None:
+        sess_opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads is not None:
+        sess_opts.inter_op_num_threads = inter_op_threads
+    return sess_opts
+
+def _session_label(model_name, intra_op_threads=None, inter_op_threads=None):
+    """Display name of a registry entry."""
+    if intra_op_threads is None and inter_op_threads is None:
+        return model_name
+    return f"{model_name} (intra-op {intra_op_threads or 'auto'}, inter-op {inter_op_threads or 'auto'})"
+
+class StageMetrics:
+    """Thread-safe per-image timings of each processing stage, summarized as percentiles.
+    
+    Any object with the same observe() method can be passed to
+    SmartBgRemover instead, to forward timings elsewhere.
+    """
+    
+    STAGES = ("discovery", "decode", "inference", "matting", "encode", "write")
+    
+    def __init__(self):
+        """Start the wall clock for throughput reporting."""
+        self._lock = threading.Lock()
+        self._observations = []
+        self._images = {}
+        self._started = time.perf_counter()
+    
+    def observe(self, stage, seconds, input_path=None):
+        """Record time spent in a stage, attributed to input_path when given."""
+        with self._lock:
+            self._observations.append((stage, seconds, input_path))
+            if input_path is not None:
+                timings = self._images.setdefault(input_path, {})
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    
+    def observations(self):
+        """Return every recorded sample as (stage, seconds, input_path) tuples."""
+        with self._lock:
+            return list(self._observations)
+    
+    def iter_timed(self, stage, iterable, key=str):
+        """Yield from iterable, recording the time spent producing each item under key(item)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start, key(item))
+            yield item
+    
+    def summary(self, image_count):
+        """Return throughput, per-stage percentiles, peak RSS and per-image timings."""
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            samples = {stage: [] for stage in self.STAGES}
+            for stage, seconds, _ in self._observations:
+                samples.setdefault(stage, []).append(seconds)
+            images = {path: dict(timings) for path, timings in self._images.items()}
+        samples = {stage: sorted(values) for stage, values in samples.items() if values}
+        
+        stages = {}
+        for stage, values in samples.items():
+            stages[stage] = {
+                "count": len(values),
+                "total_seconds": sum(values),
+                "p50_ms": _percentile(values, 0.50) * 1000,
+                "p95_ms": _percentile(values, 0.95) * 1000,
+                "p99_ms": _percentile(values, 0.99) * 1000,
+            }
+        return {
+            "images": image_count,
+            "wall_seconds": elapsed,
+            "images_per_second": image_count / elapsed if elapsed else 0.0,
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "stages": stages,
+            "per_image": images,
+        }
 
 class SmartBgRemover:
-    def __init__(self, model_name="u2net"):
-        """Initialize the background remover with specified model."""
+    def __init__(self, model_name="u2net", cache=None, registry=None, metrics=None,
+                 intra_op_threads=None, inter_op_threads=None, async_concurrency=None):
+        """Initialize the background remover with specified model, optional ResultCache,
+        SessionRegistry and StageMetrics (or any object with its observe method).
+        
+        intra_op_threads and inter_op_threads size the ONNX Runtime thread
+        pools of the session; by default each inference uses every core.
+        async_concurrency caps the images the async API processes at once
+        (default: CPU count).
+        """
         self.model_name = model_name
-        self.session = rembg.new_session(model_name=model_name)
+        self.cache = cache
+        self.registry = registry
+        self.metrics = metrics
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        # Cleared if the model rejects stacked inputs (fixed batch dimension)
+        self._batched_inference = True
+        # Created on first use of the async API
+        self.async_concurrency = async_concurrency or os.cpu_count() or 1
+        self._async_lock = threading.Lock()
+        self._async_executor = None
+        self._async_loop = None
+        self._async_slots = None
+    
+    @property
+    def session(self):
+        """The rembg session, fetched from the registry so idle runs never load the model."""
+        # Not kept on the instance, so the registry can free evicted models
+        registry = self.registry or get_session_registry()
+        return registry.get(self.model_name, self.intra_op_threads, self.inter_op_threads)
     
     def remove_background(self, input_path, output_path=None, alpha_matting=False, 
                           alpha_matting_foreground_threshold=240,
                           alpha_matting_background_threshold=10,
-                          alpha_matting_erode_size=10):
-        """Remove background from a single image."""
+                          alpha_matting_erode_size=10, fast=False, matting="pymatting",
+                          max_pixels=None, output_format=None, png_compress_level=6,
+                          webp_quality=90, webp_lossless=False, crop=False):
+        """Remove background from a single image.
+        
+        fast=True runs the model on a reduced copy; matting selects the alpha
+        matting engine ("pymatting" or the vectorized "fast" guided filter).
+        Images larger than max_pixels are masked, matted and written in strips.
+        output_format is "png", "webp" or "mask" (grayscale alpha only); by
+        default it follows the output path's extension. crop trims the result
+        to the subject's bounding box.
+        """
         # Determine output path if not provided
         if output_path is None:
-            input_path = Path(input_path)
-            output_path = input_path.parent / f"{input_path.stem}_nobg{input_path.suffix}"
+            output_path = _output_path(input_path, None, "_nobg", output_format)
         
         # Create output directory if it doesn't exist
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
         
-        # Open the image
+        # Process the image as a batch of one
+        success, result = self.remove_batch(
+            [(str(input_path), str(output_path))],
+            alpha_matting=alpha_matting,
+            alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
+            alpha_matting_background_threshold=alpha_matting_background_threshold,
+            alpha_matting_erode_size=alpha_matting_erode_size,
+            fast=fast,
+            matting=matting,
+            max_pixels=max_pixels,
+            output_format=output_format,
+            png_compress_level=png_compress_level,
+            webp_quality=webp_quality,
+            webp_lossless=webp_lossless,
+            crop=crop
+        )[0]
+        return success, output_path if success else result
+    
+    def remove_background_bytes(self, data, output_format="png", alpha_matting=False,
+                                alpha_matting_foreground_threshold=240,
+                                alpha_matting_background_threshold=10,
+                                alpha_matting_erode_size=10, fast=False, matting="pymatting",
+                                png_compress_level=6, webp_quality=90, webp_lossless=False,
+                                crop=False):
+        """Remove background from an image held in memory and return the encoded result.
+        
+        data may be encoded image bytes, a PIL image or a NumPy array;
+        output_format is "png", "webp" or "mask". Nothing touches the disk.
+        """
+        result = self._remove_in_memory(
+            data,
+            mask_only=output_format == "mask",
+            crop=crop,
+            alpha_matting=alpha_matting,
+            alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
+            alpha_matting_background_threshold=alpha_matting_background_threshold,
+            alpha_matting_erode_size=alpha_matting_erode_size,
+            fast=fast,
+            matting=matting
+        )
+        with self._timed("encode"):
+            buffer = _encode_image(result, _pil_format(output_format, None),
+                                   png_compress_level, webp_quality, webp_lossless)
+        return buffer.getvalue()
+    
+    def remove_background_array(self, image, output="rgba", alpha_matting=False,
+                                alpha_matting_foreground_threshold=240,
+                                alpha_matting_background_threshold=10,
+                                alpha_matting_erode_size=10, fast=False, matting="pymatting",
+                                crop=False):
+        """Remove background from an image held in memory and return a NumPy array.
+        
+        image may be an RGB/RGBA/grayscale uint8 array, a PIL image or encoded
+        bytes. Returns a read-only (H, W, 4) RGBA array, or (H, W) for
+        output="mask". RGBA and grayscale arrays are used without copying.
+        """
+        if output not in ("rgba", "mask"):
+            raise ValueError(f"output must be 'rgba' or 'mask', not {output!r}")
+        result = self._remove_in_memory(
+            image,
+            mask_only=output == "mask",
+            crop=crop,
+            alpha_matting=alpha_matting,
+            alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
+            alpha_matting_background_threshold=alpha_matting_background_threshold,
+            alpha_matting_erode_size=alpha_matting_erode_size,
+            fast=fast,
+            matting=matting
+        )
+        if output == "rgba" and result.mode != "RGBA":
+            result = result.convert("RGBA")
+        # One copy out of Pillow's buffer; np.asarray returns it without another
+        return np.asarray(result)
+    
+    def _remove_in_memory(self, source, mask_only=False, crop=False, input_path=None, **options):
+        """Predict, matte and optionally crop one in-memory image; returns a PIL image."""
+        with self._timed("decode", input_path):
+            # The fast cutout and fast matting both set the alpha channel in place
+            in_place = options.get("fast", False) or (
+                options.get("alpha_matting", False) and options.get("matting") == "fast"
+            )
+            img, proxy = self._load_image(source, options.get("fast", False), in_place)
+        with self._timed("inference", input_path):
+            mask = self._predict_masks([img], [proxy])[0]
+        with self._timed("matting", input_path):
+            result = self._render(img, mask, mask_only, options)
+            if crop:
+                result = _crop_to_subject(result, mask_only)
+        return result
+    
+    def _load_image(self, source, fast=False, in_place=False):
+        """Turn bytes, a PIL image or a NumPy array into (image, proxy) without temp files.
+        
+        in_place=True copies a caller's PIL image that the cutout would otherwise modify.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self._decode_for_model(io.BytesIO(source), fast)
+        
+        if isinstance(source, Image.Image):
+            img = self._orient(source)
+            if in_place and img is source and img.mode == "RGB":
+                # Keep the caller's image intact
+                img = img.copy()
+        else:
+            # Shares memory for contiguous RGBA and grayscale arrays; Pillow has no packed RGB layout
+            img = Image.fromarray(np.ascontiguousarray(source))
+        return img, self._reduce_for_model(img) if fast else img
+    
+    def remove_batch(self, jobs, fast=False, max_pixels=None, duplicates=None, **kwargs):
+        """Remove backgrounds from several (input, output) pairs with one forward pass.
+        
+        Raw predictions are handed to duplicates (a DuplicateIndex), if given,
+        for reuse by perceptual duplicates of these inputs.
+        """
+        results = [None] * len(jobs)
+        decoded = []
+        
+        # Decode every image first so one bad file does not fail the whole batch
+        for i, (input_path, output_path) in enumerate(jobs):
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                
+                with self._timed("decode", input_path):
+                    # Serve repeated inputs straight from the cache
+                    hit, key, source = self._lookup_cache(
+                        input_path, output_path, dict(kwargs, fast=fast, max_pixels=max_pixels)
+                    )
+                    if hit:
+                        results[i] = (True, output_path)
+                        continue
+                    img, proxy = self._decode_for_model(source, fast, max_pixels)
+                decoded.append((i, img, proxy, key))
+            except Exception as e:
+                results[i] = (False, f"Error processing {input_path}: {str(e)}")
+        
+        if not decoded:
+            return results
+        
+        # Run the model once for all decoded images
         try:
-            img = Image.open(input_path)
-            
-            # Process the image
-            output = rembg.remove(
-                img, 
-                session=self.session,
-                alpha_matting=alpha_matting,
-                alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
-                alpha_matting_background_threshold=alpha_matting_background_threshold,
-                alpha_matting_erode_size=alpha_matting_erode_size
+            start = time.perf_counter()
+            proxies = [proxy for _, _, proxy, _ in decoded]
+            preds = self._predict_raw(proxies)
+            masks = self._predict_masks(
+                [img for _, img, _, _ in decoded],
+                proxies,
+                max_pixels,
+                preds
             )
-            
-            # Save the result
-            output.save(output_path)
-            return True, output_path
+            self._observe_shared("inference", start, [jobs[i][0] for i, *_ in decoded])
+            if duplicates is not None:
+                for (i, *_), pred in zip(decoded, preds):
+                    duplicates.remember(jobs[i][0], pred)
         except Exception as e:
-            return False, f"Error processing {input_path}: {str(e)}"
+            for i, *_ in decoded:
+                results[i] = (False, f"Error processing {jobs[i][0]}: {str(e)}")
+            return results
+        
+        # Apply each mask and save the results
+        for (i, img, _, key), mask in zip(decoded, masks):
+            input_path, output_path = jobs[i]
+            try:
+                self._write_output(img, mask, output_path, fast=fast, max_pixels=max_pixels,
+                                   input_path=input_path, **kwargs)
+                self._store_cache(key, output_path)
+                results[i] = (True, output_path)
+            except Exception as e:
+                results[i] = (False, f"Error processing {input_path}: {str(e)}")
+        
+        return results
     
-    def process_batch(self, input_paths, output_dir=None, output_suffix="_nobg", 
-                      max_workers=None, **kwargs):
-        """Process multiple images in parallel."""
-        results = []
+    def _remove_with_pred(self, job, pred, fast=False, max_pixels=None, **kwargs):
+        """Write one (input, output) pair using another image's raw prediction, skipping the model."""
+        input_path, output_path = job
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            with self._timed("decode", input_path):
+                img, proxy = self._decode_for_model(input_path, fast, max_pixels)
+            mask = self._predict_masks([img], [proxy], max_pixels, [pred])[0]
+            self._write_output(img, mask, output_path, fast=fast, max_pixels=max_pixels,
+                               input_path=input_path, **kwargs)
+            return [(True, output_path)]
+        except Exception as e:
+            return [(False, f"Error processing {input_path}: {str(e)}")]
+    
+    @contextlib.contextmanager
+    def _timed(self, stage, input_path=None):
+        """Time the enclosed block as one stage of input_path when metrics are enabled."""
+        if self.metrics is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.observe(stage, time.perf_counter() - start, input_path)
+    
+    def _observe_shared(self, stage, start, input_paths):
+        """Split the time since start evenly across the images of a batched call."""
+        if self.metrics is None or not input_paths:
+            return
+        share = (time.perf_counter() - start) / len(input_paths)
+        for input_path in input_paths:
+            self.metrics.observe(stage, share, input_path)
+    
+    def _lookup_cache(self, input_path, output_path, options):
+        """Check the result cache; returns (hit, key, source to decode on a miss)."""
+        if self.cache is None:
+            return False, None, input_path
+        
+        with open(input_path, "rb") as f:
+            data = f.read()
+        params = dict(_PROCESSING_DEFAULTS, **options)
+        params["output_extension"] = Path(output_path).suffix.lower()
+        key = self.cache.key(data, self.model_name, params)
+        
+        if self.cache.fetch(key, output_path):
+            return True, key, None
+        # Decode from the bytes already read instead of reading the file again
+        return False, key, io.BytesIO(data)
+    
+    def _store_cache(self, key, output_path):
+        """Add a freshly written result to the cache."""
+        if key is not None:
+            self.cache.store(key, output_path)
+    
+    def _decode(self, source):
+        """Open and fully decode an image, applying its EXIF orientation."""
+        return self._orient(Image.open(source))
+    
+    def _orient(self, img):
+        """Load an opened image and apply its EXIF orientation."""
+        img.load()
+        
+        # rembg transposes by EXIF orientation; skip the copy for upright images
+        if img.getexif().get(0x0112, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        return img
+    
+    def _decode_for_model(self, source, fast=False, max_pixels=None):
+        """Decode an image and the copy the model runs on; returns (image, proxy)."""
+        img = self._decode(source)
+        if not (fast or _exceeds_budget(img, max_pixels)):
+            return img, img
+        
+        if hasattr(source, "seek"):
+            source.seek(0)
+        proxy = Image.open(source)
+        if proxy.format == "JPEG":
+            # libjpeg decodes straight to 1/2, 1/4 or 1/8 scale
+            target = self._proxy_size()
+            proxy.draft("RGB", (target, target))
+            proxy = self._orient(proxy)
+        else:
+            proxy = img
+        return img, self._reduce_for_model(proxy)
+    
+    def _proxy_size(self):
+        """Smallest side of the reduced copy the model runs on in fast mode."""
+        # The model only sees its fixed input size, so twice that is enough
+        return 2 * max(_MODEL_INPUT_SPECS.get(self.model_name, _DEFAULT_INPUT_SPEC)[2])
+    
+    def _reduce_for_model(self, img):
+        """Cheaply shrink an image to about the proxy size with box reduction."""
+        factor = min(img.size) // self._proxy_size()
+        return img.reduce(factor) if factor > 1 else img
+    
+    def _predict_masks(self, images, proxies=None, max_pixels=None, preds=None):
+        """Predict a mask per image, running the model on reduced proxies when given.
+        
+        Images over max_pixels get the raw model-resolution mask back; it is
+        upsampled strip by strip when the result is written. Raw predictions
+        already at hand can be passed as preds to skip the model.
+        """
+        proxies = proxies or images
+        if preds is None:
+            preds = self._predict_raw(proxies)
+        
+        masks = []
+        for img, proxy, pred in zip(images, proxies, preds):
+            if _exceeds_budget(img, max_pixels):
+                masks.append(pred)
+            elif proxy is not img:
+                # Only the mask is scaled up; the image never goes through the model path
+                masks.append(Image.fromarray(_upsample_mask(pred, img.size), mode="L"))
+            else:
+                # Scale the prediction back to the image size as rembg does
+                mask = Image.fromarray((pred * 255).astype("uint8"), mode="L")
+                masks.append(mask.resize(img.size, Image.LANCZOS))
+        return masks
+    
+    def _predict_raw(self, images):
+        """Run the model, stacking images into one NCHW batch; returns masks in [0, 1]."""
+        batch = self._model_input(images)
+        if batch is None:
+            # Unknown preprocessing; let rembg run the model image by image
+            return [
+                np.asarray(self.session.predict(img)[0], dtype=np.float32) / 255
+                for img in images
+            ]
+        return self._run_model(*batch)
+    
+    def _model_input(self, images):
+        """Preprocess images into (input name, NCHW batch), or None for models without a known spec."""
+        spec = _MODEL_INPUT_SPECS.get(self.model_name)
+        if spec is None:
+            return None
+        
+        mean, std, size = spec
+        session = self.session
+        feeds = [session.normalize(img, mean, std, size) for img in images]
+        input_name = next(iter(feeds[0]))
+        return input_name, np.concatenate([feed[input_name] for feed in feeds], axis=0)
+    
+    def _run_model(self, input_name, batch):
+        """Run a preprocessed NCHW batch through the model; returns masks in [0, 1]."""
+        session = self.session
+        preds = None
+        if self._batched_inference and len(batch) > 1:
+            try:
+                preds = session.inner_session.run(None, {input_name: batch})[0]
+            except Exception:
+                # Some exported models fix the batch dimension to 1
+                self._batched_inference = False
+        if preds is None:
+            preds = np.concatenate([
+                session.inner_session.run(None, {input_name: batch[i:i + 1]})[0]
+                for i in range(len(batch))
+            ], axis=0)
+        
+        # Normalize each prediction to [0, 1]
+        masks = []
+        for pred in preds[:, 0, :, :]:
+            mi, ma = pred.min(), pred.max()
+            masks.append((pred - mi) / ((ma - mi) or 1))
+        return masks
+    
+    def _cutout(self, img, mask, alpha_matting=False,
+                alpha_matting_foreground_threshold=240,
+                alpha_matting_background_threshold=10,
+                alpha_matting_erode_size=10, fast=False, matting="pymatting"):
+        """Apply a predicted mask to an image, optionally refining it with alpha matting."""
+        if alpha_matting and matting == "fast":
+            return _fast_matting_cutout(
+                img,
+                mask,
+                alpha_matting_foreground_threshold,
+                alpha_matting_background_threshold,
+                alpha_matting_erode_size
+            )
+        if alpha_matting:
+            try:
+                return rembg_bg.alpha_matting_cutout(
+                    img,
+                    mask,
+                    alpha_matting_foreground_threshold,
+                    alpha_matting_background_threshold,
+                    alpha_matting_erode_size
+                )
+            except ValueError:
+                # Same fallback as rembg.remove when matting cannot be solved
+                pass
+        
+        if fast:
+            # Assign the mask as the alpha channel in place instead of compositing
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.putalpha(mask)
+            return img
+        return rembg_bg.naive_cutout(img, mask)
+    
+    def _write_output(self, img, mask, output_path, max_pixels=None, input_path=None,
+                      output_format=None, png_compress_level=6, webp_quality=90,
+                      webp_lossless=False, crop=False, **options):
+        """Apply the mask and write the result, strip by strip for images over max_pixels."""
+        encoder = {
+            "output_format": output_format,
+            "png_compress_level": png_compress_level,
+            "webp_quality": webp_quality,
+            "webp_lossless": webp_lossless,
+        }
+        mask_only = output_format == "mask"
+        
+        if not _exceeds_budget(img, max_pixels):
+            with self._timed("matting", input_path):
+                result = self._render(img, mask, mask_only, options)
+                if crop:
+                    result = _crop_to_subject(result, mask_only)
+            self._save(result, output_path, input_path, **encoder)
+            return
+        
+        width, height = img.size
+        if isinstance(mask, Image.Image):
+            mask = np.asarray(mask, dtype=np.float32) / 255
+        
+        # Matting needs context beyond each strip; overlap strips by that much
+        margin = 0
+        if options.get("alpha_matting"):
+            erode_size = options.get("alpha_matting_erode_size", 10)
+            margin = 2 * (erode_size + max(4, erode_size)) + 1
+        strip_rows = max(16, max_pixels // width - 2 * margin)
+        
+        # Strips are written as they are produced, so the crop box comes from
+        # the low-resolution mask rather than the finished result
+        left, first_row, right, last_row = 0, 0, width, height
+        if crop:
+            bbox = _mask_bbox(mask, img.size, margin)
+            if bbox is not None:
+                left, first_row, right, last_row = bbox
+        
+        # PNG output is streamed to disk; other formats are assembled in memory
+        writer = None
+        output = None
+        channels = 1 if mask_only else 4
+        if _pil_format(output_format, output_path) == "PNG":
+            writer = _PngStripWriter(output_path, right - left, last_row - first_row,
+                                     png_compress_level, channels)
+        else:
+            output = Image.new("L" if mask_only else "RGBA", (right - left, last_row - first_row))
+        
+        try:
+            for top in range(first_row, last_row, strip_rows):
+                bottom = min(top + strip_rows, last_row)
+                context_top = max(top - margin, 0)
+                context_bottom = min(bottom + margin, height)
+                
+                with self._timed("matting", input_path):
+                    strip = img.crop((0, context_top, width, context_bottom))
+                    strip_mask = Image.fromarray(
+                        _upsample_mask_rows(mask, img.size, context_top, context_bottom), mode="L"
+                    )
+                    cutout = self._render(strip, strip_mask, mask_only, options)
+                    cutout = cutout.crop((left, top - context_top, right, bottom - context_top))
+                
+                # Streamed strips are compressed and written in one step
+                with self._timed("encode", input_path):
+                    if writer is not None:
+                        rows = np.asarray(cutout if mask_only else cutout.convert("RGBA"))
+                        writer.write(rows.reshape(rows.shape[0], rows.shape[1], channels))
+                    else:
+                        output.paste(cutout, (0, top - first_row))
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        if output is not None:
+            self._save(output, output_path, input_path, **encoder)
+    
+    def _render(self, img, mask, mask_only, options):
+        """Produce the cutout, or just its alpha channel for mask-only output."""
+        if mask_only and not options.get("alpha_matting"):
+            # The predicted mask is already the alpha channel; skip compositing
+            return mask
+        result = self._cutout(img, mask, **options)
+        return result.getchannel("A") if mask_only else result
+    
+    def _save(self, img, output_path, input_path=None, output_format=None,
+              png_compress_level=6, webp_quality=90, webp_lossless=False):
+        """Encode an image in memory and then write it, so both can be timed separately."""
+        fmt = _pil_format(output_format, output_path)
+        with self._timed("encode", input_path):
+            buffer = _encode_image(img, fmt, png_compress_level, webp_quality, webp_lossless)
+        with self._timed("write", input_path):
+            with open(output_path, "wb") as f:
+                f.write(buffer.getbuffer())
+    
+    def iter_sequence(self, source, output_dir=None, output_suffix="_nobg",
+                      keyframe_interval=10, diff_threshold=2.0, **kwargs):
+        """Process an ordered frame sequence, running the model on keyframes only.
+        
+        source is a directory of frames (taken in natural name order) or a
+        multi-frame image such as an animated GIF or multi-page TIFF. Between
+        keyframes the last keyframe's mask is reused while a frame's 64x64
+        grayscale thumbnail differs from the keyframe's by at most
+        diff_threshold (mean absolute difference, 0-255).
+        """
+        fast = kwargs.get("fast", False)
+        max_pixels = kwargs.get("max_pixels")
+        key_mask = key_thumb = key_size = None
+        since_keyframe = 0
+        
+        frames = _iter_frames(source, output_dir, output_suffix, kwargs.get("output_format"))
+        while True:
+            try:
+                name, output_path, frame = next(frames)
+            except StopIteration:
+                return
+            except Exception as e:
+                # Missing, unreadable or truncated sources end the sequence with one failure
+                record = _failure(str(source), e)
+                record["keyframe"] = False
+                yield record
+                return
+            
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                if isinstance(frame, str):
+                    with self._timed("decode", name):
+                        frame = self._decode(frame)
+                if frame.mode not in ("RGB", "RGBA", "L"):
+                    frame = frame.convert("RGB")
+                
+                thumb = np.asarray(
+                    frame.resize((64, 64), Image.BILINEAR, reducing_gap=2.0).convert("L"),
+                    dtype=np.float32
+                )
+                is_keyframe = (
+                    key_mask is None
+                    or since_keyframe >= keyframe_interval
+                    or frame.size != key_size
+                    or float(np.abs(thumb - key_thumb).mean()) > diff_threshold
+                )
+                
+                if is_keyframe:
+                    proxy = frame
+                    if fast or _exceeds_budget(frame, max_pixels):
+                        proxy = self._reduce_for_model(frame)
+                    with self._timed("inference", name):
+                        key_mask = self._predict_masks([frame], [proxy], max_pixels)[0]
+                    key_thumb, key_size, since_keyframe = thumb, frame.size, 0
+                else:
+                    since_keyframe += 1
+                
+                self._write_output(frame, key_mask, output_path, input_path=name, **kwargs)
+                record = {"input": name, "success": True, "result": output_path}
+            except Exception as e:
+                is_keyframe = False
+                record = _failure(name, e)
+            record["keyframe"] = is_keyframe
+            yield record
+    
+    def _make_executor(self, executor, max_workers):
+        """Create the thread or process pool used for batch processing."""
+        if executor == "thread":
+            return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        if executor == "process":
+            # Each worker process builds its own session once, so inference,
+            # decoding and encoding no longer contend on a single GIL
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(
+                    {
+                        "model_name": self.model_name,
+                        "cache": self.cache,
+                        "intra_op_threads": self.intra_op_threads,
+                        "inter_op_threads": self.inter_op_threads,
+                    },
+                    self.metrics is not None
+                )
+            )
+        raise ValueError(f"Unknown executor: {executor}")
+    
+    def iter_process(self, input_paths, output_dir=None, output_suffix="_nobg",
+                     max_workers=None, executor="thread", batch_size=1,
+                     max_in_flight=None, duplicates=None, schedule="input",
+                     max_in_flight_pixels=None, **kwargs):
+        """Yield a result for each image in completion order, with bounded work in flight.
+        
+        With duplicates (a DuplicateIndex), inputs matching an earlier one are
+        held back and finished from its result once it is done. schedule
+        "largest-first" reads every input's dimensions from its header and
+        starts the biggest images first so they do not finish last;
+        max_in_flight_pixels caps the total pixels being processed at once
+        (a single larger image still runs, on its own).
+        """
+        if schedule not in ("input", "largest-first"):
+            raise ValueError(f"Unknown schedule: {schedule}")
+        if duplicates is not None and duplicates.perceptual and executor != "thread":
+            raise ValueError("Perceptual duplicate detection needs the thread executor")
         
         # Create output directory if specified
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
         
-        # Process images in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            
-            for input_path in input_paths:
-                input_path = Path(input_path)
+        # Limit how many images are submitted but not yet collected, so memory
+        # stays flat no matter how long the input iterable is
+        if max_in_flight is None:
+            max_in_flight = 2 * (max_workers or os.cpu_count() or 1) * batch_size
+        
+        if executor == "thread":
+            _import_runtime()
+        pool = self._make_executor(executor, max_workers)
+        pending = {}
+        pending_pixels = {}
+        pixels = {}
+        try:
+            jobs_iter = self._iter_jobs(input_paths, output_dir, output_suffix,
+                                        kwargs.get("output_format"))
+            if schedule == "largest-first":
+                # Longest job first keeps the slowest images from running alone at the end
+                jobs_list = list(jobs_iter)
+                pixels = dict(zip(
+                    (input_path for input_path, _ in jobs_list),
+                    _estimate_pixels([input_path for input_path, _ in jobs_list])
+                ))
+                jobs_list.sort(key=lambda job: pixels[job[0]], reverse=True)
+                jobs_iter = iter(jobs_list)
+            if duplicates is not None:
+                jobs_iter = (
+                    job for job, fingerprint in duplicates.iter_fingerprinted(jobs_iter)
+                    if not duplicates.hold(job, fingerprint)
+                )
+            for jobs in _chunked(jobs_iter, batch_size):
+                if max_in_flight_pixels is not None:
+                    batch_pixels = sum(
+                        pixels.pop(input_path) if input_path in pixels else _image_pixels(input_path)
+                        for input_path, _ in jobs
+                    )
+                    # Wait until the batch fits in the pixel budget
+                    while (pending and self._pixels_in_flight(pending, pending_pixels) + batch_pixels
+                           > max_in_flight_pixels):
+                        yield from self._collect(pending, executor, duplicates, pool, kwargs)
                 
-                # Determine output path
-                if output_dir:
-                    output_path = Path(output_dir) / f"{input_path.stem}{output_suffix}{input_path.suffix}"
-                else:
-                    output_path = input_path.parent / f"{input_path.stem}{output_suffix}{input_path.suffix}"
+                future = self._submit(pool, executor, jobs, kwargs, duplicates)
+                pending[future] = jobs
+                if max_in_flight_pixels is not None:
+                    pending_pixels[future] = batch_pixels
                 
-                # Submit task to executor
-                future = executor.submit(
-                    self.remove_background, 
-                    str(input_path), 
-                    str(output_path),
-                    **kwargs
+                # Wait for a slot before reading further input
+                while sum(len(jobs) for jobs in pending.values()) >= max_in_flight:
+                    yield from self._collect(pending, executor, duplicates, pool, kwargs)
+            
+            while pending or (duplicates is not None and duplicates.released):
+                yield from self._collect(pending, executor, duplicates, pool, kwargs)
+        finally:
+            # Drop queued work if the caller stops iterating early
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def process_batch(self, input_paths, output_dir=None, output_suffix="_nobg", 
+                      max_workers=None, executor="thread", batch_size=1, **kwargs):
+        """Process multiple images in parallel and return results in input order."""
+        input_paths = list(input_paths)
+        # Positions of each input; the same path may be listed more than once
+        positions = {}
+        for i, input_path in enumerate(input_paths):
+            positions.setdefault(str(input_path), []).append(i)
+        records = self.iter_process(
+            input_paths,
+            output_dir=output_dir,
+            output_suffix=output_suffix,
+            max_workers=max_workers,
+            executor=executor,
+            batch_size=batch_size,
+            **kwargs
+        )
+        results = [None] * len(input_paths)
+        for record in tqdm.tqdm(records, total=len(input_paths), desc="Removing backgrounds"):
+            results[positions[record["input"]].pop(0)] = record
+        return results
+    
+    def iter_process_bytes(self, items, max_workers=None, max_in_flight=None, **kwargs):
+        """Yield a record per (name, encoded image bytes) item in completion order.
+        
+        Successful records carry the encoded output bytes as their result;
+        kwargs are passed to remove_background_bytes.
+        """
+        if max_in_flight is None:
+            max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+        
+        _import_runtime()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = set()
+        try:
+            for name, data in items:
+                pending.add(pool.submit(self._remove_bytes_record, name, data, kwargs))
+                
+                # Bound the encoded inputs and outputs held in memory at once
+                while len(pending) >= max_in_flight:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield future.result()
+            
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def _remove_bytes_record(self, name, data, kwargs):
+        """Process one in-memory image into a result record."""
+        try:
+            output_format = kwargs.get("output_format") or "png"
+            cutout_options = {
+                key: value for key, value in kwargs.items()
+                if key not in ("output_format", "png_compress_level", "webp_quality",
+                               "webp_lossless", "crop")
+            }
+            result = self._remove_in_memory(
+                data,
+                mask_only=output_format == "mask",
+                crop=kwargs.get("crop", False),
+                input_path=name,
+                **cutout_options
+            )
+            with self._timed("encode", name):
+                buffer = _encode_image(
+                    result,
+                    _pil_format(output_format, None),
+                    kwargs.get("png_compress_level", 6),
+                    kwargs.get("webp_quality", 90),
+                    kwargs.get("webp_lossless", False)
                 )
-                futures.append((future, input_path))
+            return {"input": name, "success": True, "result": buffer.getvalue()}
+        except Exception as e:
+            return _failure(name, e)
+    
+    async def remove_background_async(self, input_path, output_path=None, **kwargs):
+        """Awaitable remove_background, run on the remover's executor.
+        
+        Calls beyond async_concurrency wait for a free slot; cancelling a
+        waiting call drops it, while one already running finishes in the
+        background and its result is discarded.
+        """
+        async with self._async_semaphore():
+            return await asyncio.get_running_loop().run_in_executor(
+                self._async_pool(),
+                functools.partial(self.remove_background, input_path, output_path, **kwargs)
+            )
+    
+    async def aiter_process(self, input_paths, output_dir=None, output_suffix="_nobg", **kwargs):
+        """Async-iterate a record per image in completion order.
+        
+        input_paths may be a regular or an async iterable; it is only read
+        as slots free up. Closing the iterator or cancelling the consuming
+        task cancels every image that has not started.
+        """
+        # Create output directory if specified
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        pending = set()
+        try:
+            async for input_path in _aiter_paths(input_paths):
+                output_path = _output_path(input_path, output_dir, output_suffix, kwargs.get("output_format"))
+                pending.add(asyncio.ensure_future(self._remove_record_async(str(input_path), output_path, kwargs)))
+                
+                # Wait for a slot before reading further input
+                while len(pending) >= self.async_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
             
-            # Process results with progress bar
-            for future, input_path in tqdm(futures, desc="Removing backgrounds"):
-                success, result = future.result()
-                results.append({
-                    "input": str(input_path),
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def close(self):
+        """Shut down the async API's executor, dropping work that has not started."""
+        with self._async_lock:
+            executor, self._async_executor = self._async_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    async def _remove_record_async(self, input_path, output_path, kwargs):
+        """Process one image on the executor once a slot is free and return its record."""
+        async with self._async_semaphore():
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._async_pool(),
+                functools.partial(self.remove_batch, [(input_path, output_path)], **kwargs)
+            )
+        success, result = results[0]
+        return {"input": input_path, "success": success, "result": result}
+    
+    def _async_semaphore(self):
+        """The concurrency limit for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            # Semaphores belong to one loop; a remover may outlive it
+            if self._async_loop is not loop:
+                self._async_loop = loop
+                self._async_slots = asyncio.Semaphore(self.async_concurrency)
+            return self._async_slots
+    
+    def _async_pool(self):
+        """The thread pool the async API runs decode, inference and encode on."""
+        with self._async_lock:
+            if self._async_executor is None:
+                # Called from the event loop thread, before any worker thread imports rembg
+                _import_runtime()
+                self._async_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.async_concurrency,
+                    thread_name_prefix="bg_remover"
+                )
+            return self._async_executor
+    
+    def _iter_jobs(self, input_paths, output_dir, output_suffix, output_format=None):
+        """Yield (input, output) path pairs for the given inputs."""
+        for input_path in input_paths:
+            yield str(input_path), _output_path(input_path, output_dir, output_suffix, output_format)
+    
+    def _pixels_in_flight(self, pending, pending_pixels):
+        """Total estimated pixels of the batches still pending, forgetting finished ones."""
+        for future in [future for future in pending_pixels if future not in pending]:
+            del pending_pixels[future]
+        return sum(pending_pixels.values())
+    
+    def _submit(self, pool, executor, jobs, kwargs, duplicates=None):
+        """Submit a batch of (input, output) pairs to the pool."""
+        if executor == "process":
+            return pool.submit(_remove_in_worker, jobs, kwargs)
+        return pool.submit(self.remove_batch, jobs, duplicates=duplicates, **kwargs)
+    
+    def _collect(self, pending, executor="thread", duplicates=None, pool=None, kwargs=None):
+        """Wait for at least one pending batch and yield its result records."""
+        if duplicates is not None:
+            yield from self._finish_duplicates(duplicates, pending, executor, pool, kwargs)
+        if not pending:
+            return
+        
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            jobs = pending.pop(future)
+            results = future.result()
+            if executor == "process":
+                # Worker processes send their stage timings back with the results
+                results, observations = results
+                for observation in observations:
+                    self.metrics.observe(*observation)
+            for (input_path, _), (success, result) in zip(jobs, results):
+                record = {
+                    "input": input_path,
                     "success": success,
                     "result": result
+                }
+                if duplicates is not None:
+                    duplicates.finish(record)
+                yield record
+    
+    def _finish_duplicates(self, duplicates, pending, executor, pool, kwargs):
+        """Copy the outputs of released exact duplicates and queue perceptual ones.
+        
+        Duplicates whose representative failed, or whose prediction is no
+        longer remembered, are processed like any other input.
+        """
+        released, duplicates.released = duplicates.released, []
+        for job, kind, representative, (success, result) in released:
+            input_path, output_path = job
+            pred = duplicates.pred(representative) if kind == "perceptual" and success else None
+            
+            if kind == "exact" and success:
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                    if os.path.abspath(result) != os.path.abspath(output_path):
+                        shutil.copyfile(result, output_path)
+                    record = {"input": input_path, "success": True, "result": output_path}
+                    duplicates.exact_count += 1
+                except Exception as e:
+                    record = _failure(input_path, e)
+                duplicates.finish(record)
+                yield record
+            elif pred is not None:
+                pending[pool.submit(self._remove_with_pred, job, pred, **kwargs)] = [job]
+                duplicates.perceptual_count += 1
+            else:
+                pending[self._submit(pool, executor, [job], kwargs, duplicates)] = [job]
+
+async def _aiter_paths(paths):
+    """Iterate a regular or async iterable of paths asynchronously."""
+    if hasattr(paths, "__aiter__"):
+        async for path in paths:
+            yield path
+    else:
+        for path in paths:
+            yield path
+
+# Per-process remover used by the process executor; built once by _init_worker
+_worker_remover = None
+
+def _init_worker(config, collect_metrics=False):
+    """Load a dedicated model session in a worker process."""
+    global _worker_remover
+    _import_runtime()
+    _worker_remover = SmartBgRemover(**config)
+    if _worker_remover.cache is not None:
+        # Sibling workers write to the same directory (forked workers never go through __reduce__)
+        _worker_remover.cache.shared = True
+    if collect_metrics:
+        _worker_remover.metrics = StageMetrics()
+
+def _remove_in_worker(jobs, kwargs):
+    """Remove the backgrounds of a batch of images inside a worker process."""
+    metrics = _worker_remover.metrics
+    if metrics is not None:
+        # Fresh metrics per batch so each observation is sent back exactly once
+        metrics = _worker_remover.metrics = StageMetrics()
+    results = _worker_remover.remove_batch(jobs, **kwargs)
+    # Only send back small records, never pixel data
+    observations = metrics.observations() if metrics is not None else []
+    return [(success, str(result)) for success, result in results], observations
+
+# Sentinel passed through pipeline queues when a stage has no more work
+_STOP = object()
+
+class StagedPipeline:
+    """Run decode, inference and encode on separate threads joined by bounded queues."""
+    
+    def __init__(self, remover, decode_workers=2, infer_workers=1, encode_workers=2,
+                 queue_size=8, batch_size=1):
+        """Configure worker counts per stage and the size of each queue between stages."""
+        self.remover = remover
+        self.decode_workers = decode_workers
+        self.infer_workers = infer_workers
+        self.encode_workers = encode_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queues = {}
+        self._peaks = {}
+        self._stop = threading.Event()
+        self._error = None
+        self._options = {}
+    
+    def queue_depths(self):
+        """Return how many items are waiting in front of each stage right now."""
+        return {name: q.qsize() for name, q in self._queues.items()}
+    
+    def peak_queue_depths(self):
+        """Return the largest depth seen in front of each stage during the run."""
+        return dict(self._peaks)
+    
+    def run(self, input_paths, output_dir=None, output_suffix="_nobg", **kwargs):
+        """Yield a result record for each image as it leaves the encode stage."""
+        # Create output directory if specified
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        _import_runtime()
+        self._stop = threading.Event()
+        self._error = None
+        self._options = kwargs
+        self._queues = {
+            name: queue.Queue(self.queue_size)
+            for name in ("decode", "infer", "encode", "results")
+        }
+        self._peaks = dict.fromkeys(self._queues, 0)
+        
+        # Each stage signals the next one once its last worker has finished
+        jobs = self.remover._iter_jobs(input_paths, output_dir, output_suffix,
+                                       kwargs.get("output_format"))
+        threads = [threading.Thread(target=self._feed, args=(jobs,), daemon=True)]
+        threads += self._start_stage("decode", self._decode, self.decode_workers,
+                                     "infer", self.infer_workers)
+        threads += self._start_stage("infer", self._infer, self.infer_workers,
+                                     "encode", self.encode_workers, batch_size=self.batch_size)
+        threads += self._start_stage("encode", self._encode, self.encode_workers, "results", 1)
+        for thread in threads:
+            thread.start()
+        
+        try:
+            while True:
+                record = self._queues["results"].get()
+                if record is _STOP:
+                    break
+                yield record
+        finally:
+            # Unblock every stage if the caller stops iterating early
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        
+        if self._error is not None:
+            raise self._error
+    
+    def _feed(self, jobs):
+        """Push (input, output) pairs into the decode queue."""
+        try:
+            for job in jobs:
+                if not self._put("decode", job):
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            for _ in range(self.decode_workers):
+                self._put("decode", _STOP)
+    
+    def _start_stage(self, name, handler, workers, downstream, downstream_workers, batch_size=1):
+        """Create the threads for one stage."""
+        remaining = [workers]
+        lock = threading.Lock()
+        
+        def worker():
+            try:
+                self._work(name, handler, downstream, batch_size)
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(downstream_workers):
+                        self._put(downstream, _STOP)
+        
+        return [
+            threading.Thread(target=worker, name=f"bg-remover-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+    
+    def _work(self, name, handler, downstream, batch_size):
+        """Take items from a stage's queue, handle them and pass the output downstream."""
+        inbox = self._queues[name]
+        while True:
+            item = self._get(name)
+            if item is _STOP:
+                return
+            
+            # Gather whatever else is already waiting, up to the batch size
+            items = [item]
+            stopping = False
+            while len(items) < batch_size:
+                try:
+                    item = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+            
+            for output in handler(items):
+                self._put(downstream, output)
+            if stopping:
+                return
+    
+    def _get(self, name):
+        """Take the next item from a queue, or _STOP once the run is cancelled."""
+        while not self._stop.is_set():
+            try:
+                return self._queues[name].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+    
+    def _put(self, name, item):
+        """Put an item on a queue, blocking while it is full; False if cancelled."""
+        q = self._queues[name]
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self._peaks[name] = max(self._peaks[name], q.qsize())
+            return True
+        return False
+    
+    def _decode(self, jobs):
+        """Decode stage: read images from disk."""
+        decoded = []
+        for input_path, output_path in jobs:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                
+                with self.remover._timed("decode", input_path):
+                    # Cache hits skip inference and encoding entirely
+                    hit, key, source = self.remover._lookup_cache(input_path, output_path, self._options)
+                    if hit:
+                        self._put("results", {
+                            "input": input_path,
+                            "success": True,
+                            "result": output_path
+                        })
+                        continue
+                    img, proxy = self.remover._decode_for_model(
+                        source,
+                        self._options.get("fast", False),
+                        self._options.get("max_pixels")
+                    )
+                decoded.append((input_path, output_path, img, proxy, key))
+            except Exception as e:
+                self._put("results", _failure(input_path, e))
+        return decoded
+    
+    def _infer(self, items):
+        """Inference stage: predict masks for a batch of decoded images."""
+        try:
+            start = time.perf_counter()
+            masks = self.remover._predict_masks(
+                [item[2] for item in items],
+                [item[3] for item in items],
+                self._options.get("max_pixels")
+            )
+            self.remover._observe_shared("inference", start, [item[0] for item in items])
+        except Exception as e:
+            for input_path, *_ in items:
+                self._put("results", _failure(input_path, e))
+            return []
+        return [item + (mask,) for item, mask in zip(items, masks)]
+    
+    def _encode(self, items):
+        """Encode stage: apply masks and write the results."""
+        records = []
+        for input_path, output_path, img, _, key, mask in items:
+            try:
+                self.remover._write_output(img, mask, output_path, input_path=input_path, **self._options)
+                self.remover._store_cache(key, output_path)
+                records.append({
+                    "input": input_path,
+                    "success": True,
+                    "result": output_path
                 })
+            except Exception as e:
+                records.append(_failure(input_path, e))
+        return records
+
+def _failure(input_path, error):
+    """Build the result record for an image that could not be processed."""
+    return {
+        "input": input_path,
+        "success": False,
+        "result": f"Error processing {input_path}: {str(error)}"
+    }
+
+def _upsample_mask(mask, size, block_rows=512):
+    """Bilinearly resize a [0, 1] float mask to size=(width, height) as uint8 with NumPy."""
+    width, height = size
+    out = np.empty((height, width), dtype=np.uint8)
+    # Work in blocks of output rows so temporaries stay small for huge images
+    for start in range(0, height, block_rows):
+        stop = min(start + block_rows, height)
+        out[start:stop] = _upsample_mask_rows(mask, size, start, stop)
+    return out
+
+def _upsample_mask_rows(mask, size, start, stop):
+    """Rows start:stop of a [0, 1] float mask bilinearly resized to size, as uint8."""
+    width, height = size
+    src_height, src_width = mask.shape
+    
+    # Source coordinates of each output pixel centre
+    xs = np.clip((np.arange(width, dtype=np.float32) + 0.5) * (src_width / width) - 0.5, 0, src_width - 1)
+    ys = np.clip((np.arange(start, stop, dtype=np.float32) + 0.5) * (src_height / height) - 0.5,
+                 0, src_height - 1)
+    x0 = xs.astype(np.intp)
+    y0 = ys.astype(np.intp)
+    x1 = np.minimum(x0 + 1, src_width - 1)
+    y1 = np.minimum(y0 + 1, src_height - 1)
+    wx = xs - x0
+    wy = (ys - y0)[:, None]
+    
+    # Interpolate along x on the few source rows needed, then along y
+    rows = np.unique(np.concatenate([y0, y1]))
+    lookup = np.searchsorted(rows, np.arange(src_height))
+    selected = mask[rows]
+    source = selected[:, x0] * (1 - wx) + selected[:, x1] * wx
+    block = source[lookup[y0]] * (1 - wy) + source[lookup[y1]] * wy
+    block *= 255
+    block += 0.5
+    return block.astype(np.uint8)
+
+def _exceeds_budget(img, max_pixels):
+    """Return True if an image has more pixels than the per-image budget."""
+    return max_pixels is not None and img.size[0] * img.size[1] > max_pixels
+
+class _PngStripWriter:
+    """Write an RGBA (or grayscale) PNG from consecutive row strips without holding the whole image."""
+    
+    def __init__(self, path, width, height, compress_level=6, channels=4):
+        """Create the file and write the PNG header for an 8-bit RGBA or grayscale image."""
+        self._file = open(path, "wb")
+        self._compressor = zlib.compressobj(compress_level)
+        self._channels = channels
+        color_type = 6 if channels == 4 else 0
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+    
+    def write(self, rows):
+        """Append an (n, width, channels) uint8 array of rows."""
+        count, width, _ = rows.shape
+        bpp = self._channels
+        raw = rows.reshape(count, width * bpp)
         
-        return results
+        # Sub filter: store each byte as the difference to the pixel on its left
+        filtered = np.empty((count, width * bpp + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:bpp + 1] = raw[:, :bpp]
+        np.subtract(raw[:, bpp:], raw[:, :-bpp], out=filtered[:, bpp + 1:])
+        
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+    
+    def close(self):
+        """Flush the compressed stream and finish the file."""
+        if self._file.closed:
+            return
+        try:
+            self._chunk(b"IDAT", self._compressor.flush())
+            self._chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+    
+    def _chunk(self, kind, data):
+        """Write one length-prefixed, CRC-terminated PNG chunk."""
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+def _fast_matting_cutout(img, mask, foreground_threshold, background_threshold,
+                         erode_size):
+    """Refine a mask with a guided filter inside the trimap band and apply it as alpha."""
+    mask_array = np.asarray(mask)
+    is_foreground = mask_array > foreground_threshold
+    is_background = mask_array < background_threshold
+    
+    # Pixels that are undecided, or where the mask jumps between foreground
+    # and background, need refining; everything else is already final
+    undecided = ~(is_foreground | is_background)
+    active = undecided.copy()
+    for labels in (is_foreground, is_background):
+        active[:-1] |= labels[:-1] != labels[1:]
+        active[:, :-1] |= labels[:, :-1] != labels[:, 1:]
+    alpha = is_foreground.astype(np.uint8) * 255
+    
+    rows = np.flatnonzero(active.any(axis=1))
+    cols = np.flatnonzero(active.any(axis=0))
+    if rows.size:
+        radius, eps = _guided_filter_params(undecided, active, erode_size)
+        # Work only on the band's bounding box, padded by the filter reach
+        margin = erode_size + radius + 1
+        top = max(rows[0] - margin, 0)
+        bottom = min(rows[-1] + margin + 1, mask_array.shape[0])
+        left = max(cols[0] - margin, 0)
+        right = min(cols[-1] + margin + 1, mask_array.shape[1])
+        region = (slice(top, bottom), slice(left, right))
+        
+        foreground = is_foreground[region]
+        background = is_background[region]
+        if erode_size > 0:
+            foreground = _erode(foreground, erode_size)
+            background = _erode(background, erode_size)
+        
+        guide = np.asarray(img.crop((left, top, right, bottom)).convert("RGB"), dtype=np.float32) / 255
+        coarse = mask_array[region].astype(np.float32) / 255
+        refined = _guided_filter(guide, coarse, radius, eps)
+        
+        refined = np.where(foreground, 1.0, np.where(background, 0.0, np.clip(refined, 0, 1)))
+        alpha[region] = (refined * 255 + 0.5).astype(np.uint8)
+    
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.putalpha(Image.fromarray(alpha, mode="L"))
+    return img
+
+def _guided_filter_params(undecided, active, erode_size):
+    """Pick the guided filter radius and eps from the width of the trimap band."""
+    # Band area over its length (pixels next to a decided label) is its mean width
+    edge = active & ~undecided
+    band_width = undecided.sum() / max(edge.sum() / 2, 1) + 2 * erode_size
+    # The window has to span the band to see both colours, but no more
+    radius = int(min(max(round(band_width / 2), 8), 32))
+    # Wider windows average more colours: regularise more so noise is not amplified
+    eps = 3e-5 * (radius / 8) ** 2
+    return radius, eps
+
+def _guided_filter(guide, source, radius, eps):
+    """Colour guided filter (He et al.) of a single-channel source by an RGB guide."""
+    means = [_box_mean(guide[..., c], radius) for c in range(3)]
+    mean_source = _box_mean(source, radius)
+    covariance = np.stack(
+        [_box_mean(guide[..., c] * source, radius) - means[c] * mean_source for c in range(3)],
+        axis=-1,
+    )
+    # Per-pixel 3x3 colour covariance, regularised by eps on the diagonal
+    sigma = {}
+    for i in range(3):
+        for j in range(i, 3):
+            sigma[i, j] = _box_mean(guide[..., i] * guide[..., j], radius) - means[i] * means[j]
+        sigma[i, i] += eps
+    # Solve sigma @ a = covariance per pixel with the closed-form 3x3 inverse
+    cofactor = {
+        (0, 0): sigma[1, 1] * sigma[2, 2] - sigma[1, 2] ** 2,
+        (0, 1): sigma[0, 2] * sigma[1, 2] - sigma[0, 1] * sigma[2, 2],
+        (0, 2): sigma[0, 1] * sigma[1, 2] - sigma[0, 2] * sigma[1, 1],
+        (1, 1): sigma[0, 0] * sigma[2, 2] - sigma[0, 2] ** 2,
+        (1, 2): sigma[0, 1] * sigma[0, 2] - sigma[0, 0] * sigma[1, 2],
+        (2, 2): sigma[0, 0] * sigma[1, 1] - sigma[0, 1] ** 2,
+    }
+    determinant = (sigma[0, 0] * cofactor[0, 0] + sigma[0, 1] * cofactor[0, 1]
+                   + sigma[0, 2] * cofactor[0, 2])
+    a = np.stack(
+        [sum(cofactor[min(i, j), max(i, j)] * covariance[..., j] for j in range(3)) / determinant
+         for i in range(3)],
+        axis=-1,
+    )
+    b = mean_source - (a * np.stack(means, axis=-1)).sum(axis=-1)
+    mean_a = np.stack([_box_mean(a[..., c], radius) for c in range(3)], axis=-1)
+    return (mean_a * guide).sum(axis=-1) + _box_mean(b, radius)
+
+def _box_sum(integral, height, width, before, after):
+    """Sum over a window around every pixel from an integral image, clamped at the edges."""
+    y0 = np.clip(np.arange(height) - before, 0, height)
+    y1 = np.clip(np.arange(height) + after + 1, 0, height)
+    x0 = np.clip(np.arange(width) - before, 0, width)
+    x1 = np.clip(np.arange(width) + after + 1, 0, width)
+    total = integral[y1][:, x1] - integral[y0][:, x1] - integral[y1][:, x0] + integral[y0][:, x0]
+    count = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+    return total, count
+
+def _integral(array, dtype):
+    """Zero-padded 2-D cumulative sum of an array."""
+    integral = np.zeros((array.shape[0] + 1, array.shape[1] + 1), dtype=dtype)
+    np.cumsum(array, axis=0, dtype=dtype, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return integral
+
+def _box_mean(array, radius):
+    """Mean over a (2 * radius + 1) square window, clamped at the edges."""
+    total, count = _box_sum(_integral(array, np.float64), *array.shape, radius, radius)
+    return (total / count).astype(np.float32)
+
+def _erode(labels, size):
+    """Binary erosion with a size x size square; pixels outside the array count as set."""
+    before = size // 2
+    total, count = _box_sum(_integral(labels, np.int64), *labels.shape, before, size - before - 1)
+    return total == count
+
+def _iter_frames(source, output_dir, output_suffix, output_format=None):
+    """Yield (name, output path, frame or frame path) for each frame of a sequence."""
+    if os.path.isdir(source):
+        for path in sorted(iter_image_files([source]), key=_natural_key):
+            yield path, _output_path(path, output_dir, output_suffix, output_format), path
+        return
+    
+    # Multi-frame files: one output image per frame, numbered in order
+    source_path = Path(source)
+    directory = Path(output_dir) if output_dir else source_path.parent
+    with Image.open(source) as img:
+        for index in range(getattr(img, "n_frames", 1)):
+            img.seek(index)
+            extension = _OUTPUT_EXTENSIONS[output_format]
+            output_path = directory / f"{source_path.stem}_{index:05d}{output_suffix}{extension}"
+            yield f"{source}[{index}]", str(output_path), img.convert("RGB")
+
+def _natural_key(path):
+    """Sort key that orders frame_2 before frame_10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+def _output_path(input_path, output_dir, output_suffix, output_format=None):
+    """Determine where the result for input_path is written."""
+    input_path = Path(input_path)
+    # The extension follows the output format, never the input (RGBA cannot be a JPEG)
+    name = f"{input_path.stem}{output_suffix}{_OUTPUT_EXTENSIONS[output_format]}"
+    if output_dir:
+        return str(Path(output_dir) / name)
+    return str(input_path.parent / name)
+
+def _pil_format(output_format, output_path):
+    """Pillow format name for an output format, or from the path's extension for None."""
+    if output_format in ("png", "mask") or (output_format is None and output_path is None):
+        return "PNG"
+    if output_format == "webp":
+        return "WEBP"
+    if output_format is not None:
+        raise ValueError(f"unknown output format: {output_format}")
+    suffix = Path(output_path).suffix.lower()
+    fmt = Image.registered_extensions().get(suffix)
+    if fmt is None:
+        raise ValueError(f"unknown file extension: {suffix}")
+    return fmt
+
+def _encode_image(img, fmt, png_compress_level=6, webp_quality=90, webp_lossless=False):
+    """Encode an image into an in-memory buffer with the format's settings."""
+    params = {}
+    if fmt == "PNG":
+        params["compress_level"] = png_compress_level
+    elif fmt == "WEBP":
+        params.update(quality=webp_quality, lossless=webp_lossless)
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer
+
+def _crop_to_subject(result, mask_only):
+    """Crop a cutout (or mask) to the bounding box of its non-transparent pixels."""
+    bbox = (result if mask_only else result.getchannel("A")).getbbox()
+    return result.crop(bbox) if bbox is not None else result
+
+def _mask_bbox(mask, size, margin=0):
+    """Bounding box of the non-zero area of a low-resolution mask once upsampled to size.
+    
+    Conservative: includes every output pixel that bilinear upsampling can
+    make non-zero, plus margin pixels for alpha matting to spread into.
+    """
+    # The normalized prediction is rarely exactly zero; only values that
+    # round to an alpha of at least 1 count as subject
+    ys, xs = np.nonzero(mask >= 0.5 / 255)
+    if not len(ys):
+        return None
+    width, height = size
+    src_height, src_width = mask.shape
+    
+    def span(low, high, scale, limit):
+        # Output pixels whose interpolation reads source pixels low..high
+        start = int(np.floor((low - 0.5) * scale - 0.5)) - margin
+        stop = int(np.ceil((high + 1.5) * scale - 0.5)) + margin
+        return max(start, 0), min(stop, limit)
+    
+    left, right = span(xs.min(), xs.max(), width / src_width, width)
+    top, bottom = span(ys.min(), ys.max(), height / src_height, height)
+    return left, top, right, bottom
+
+def _model_bytes(model_name):
+    """Approximate resident size of a model; unknown models count as the largest."""
+    return _MODEL_BYTES.get(model_name, max(_MODEL_BYTES.values()))
+
+def _file_sha256(path):
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _dhash(path):
+    """64-bit difference hash of an image's 9x8 thumbnail, and its upright aspect ratio."""
+    with Image.open(path) as img:
+        width, height = img.size
+        # EXIF orientations 5-8 swap width and height
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        img.draft("L", (64, 64))
+        gray = np.asarray(
+            ImageOps.exif_transpose(img).convert("L").resize((9, 8), Image.BILINEAR, reducing_gap=2.0),
+            dtype=np.int16
+        )
+    bits = np.packbits(gray[:, 1:] > gray[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big"), width / height
+
+def _image_pixels(path):
+    """Pixel count of an image read from its header alone, without decoding; 0 if unreadable."""
+    try:
+        with Image.open(path) as img:
+            return img.width * img.height
+    except Exception:
+        # Unreadable inputs fail fast once processed
+        return 0
+
+def _estimate_pixels(paths, workers=16):
+    """Header-only pixel counts for many paths, read concurrently since each is a small I/O."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_image_pixels, paths))
+
+def _shard_of(path, shard_count):
+    """Stable shard number of an input path, identical on every machine and Python run."""
+    key = str(path).replace(os.sep, "/").encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big") % shard_count
+
+def _shard_manifest_path(path, shard_index, shard_count):
+    """Per-shard variant of a manifest path, e.g. run.shard-00003-of-00016.jsonl."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.shard-{shard_index:05d}-of-{shard_count:05d}{path.suffix}")
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(len(sorted_values), rank) - 1]
+
+def _peak_rss_bytes():
+    """Peak resident memory of this process and of finished worker processes, if known."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _chunked(iterable, size):
+    """Yield lists of up to size items from an iterable without materializing it."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+# File extensions treated as images during discovery
+_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+_ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
 
 def find_image_files(paths):
     """Find all image files in the given paths."""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
-    image_files = []
-    
+    return list(iter_image_files(paths))
+
+def iter_image_files(paths, include=None, exclude=None, workers=1):
+    """Yield image files in the given paths as soon as they are found."""
     for path in paths:
-        path = Path(path)
-        if path.is_file() and path.suffix.lower() in image_extensions:
-            image_files.append(str(path))
-        elif path.is_dir():
-            for img_path in path.glob('**/*'):
-                if img_path.is_file() and img_path.suffix.lower() in image_extensions:
-                    image_files.append(str(img_path))
+        path = str(path)
+        if os.path.isfile(path):
+            if _is_image_name(path) and _matches_globs(path, include, exclude):
+                yield path
+        elif os.path.isdir(path):
+            yield from _walk_images(path, include, exclude, workers)
+
+def iter_listed_files(source, include=None, exclude=None):
+    """Yield the paths listed one per line in a text file, or stdin for '-'."""
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        for line in f:
+            path = line.strip()
+            if path and _matches_globs(path, include, exclude):
+                yield path
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def iter_archive_members(path, include=None, exclude=None):
+    """Yield (member name, bytes) for each image in a tar or zip archive, in archive order."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                if not info.is_dir() and _is_image_name(name) and _matches_globs(name, include, exclude):
+                    yield name, archive.read(info)
+        return
+    
+    # Stream mode reads the archive front to back, compressed or not, without seeking
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            name = member.name
+            if member.isfile() and _is_image_name(name) and _matches_globs(name, include, exclude):
+                yield name, archive.extractfile(member).read()
+
+def _safe_member_name(name):
+    """Normalised relative form of an archive member name, or None if it is absolute or uses '..'."""
+    name = name.replace("\\", "/")
+    if name.startswith("/") or re.match(r"[A-Za-z]:", name):
+        return None
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return "/".join(parts)
+
+def _archive_stem(path):
+    """Archive file name without its archive extension, e.g. photos for photos.tar.gz."""
+    name = os.path.basename(path)
+    for extension in sorted(_ARCHIVE_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith(extension):
+            return name[:-len(extension)] or name
+    return name
+
+def _is_archive_name(path):
+    """Return True if a path names a tar or zip archive."""
+    return str(path).lower().endswith(_ARCHIVE_EXTENSIONS)
+
+def _walk_images(root, include, exclude, workers):
+    """Walk a directory tree, scanning directories on several threads if requested."""
+    if workers <= 1:
+        stack = [root]
+        while stack:
+            files, subdirs = _scan_directory(stack.pop(), root, include, exclude)
+            yield from files
+            stack.extend(reversed(subdirs))
+        return
+    
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {pool.submit(_scan_directory, root, root, include, exclude)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(
+                    pool.submit(_scan_directory, subdir, root, include, exclude)
+                    for subdir in subdirs
+                )
+                yield from files
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _scan_directory(directory, root, include, exclude):
+    """List one directory, returning (image files, subdirectories to descend into)."""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # DirEntry caches the file type from the directory listing, so
+                # no extra stat is needed for regular files and directories
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not exclude or not _matches_any(os.path.relpath(entry.path, root), exclude):
+                            subdirs.append(entry.path)
+                    elif _is_image_name(entry.name) and entry.is_file():
+                        if _matches_globs(os.path.relpath(entry.path, root), include, exclude):
+                            files.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        # Unreadable directories are skipped like glob() does
+        pass
+    return files, subdirs
+
+def _is_image_name(name):
+    """Return True if a file name has an image extension."""
+    return os.path.splitext(name)[1].lower() in _IMAGE_EXTENSIONS
+
+def _matches_globs(path, include, exclude):
+    """Apply include/exclude glob patterns to a (relative) path."""
+    if include and not _matches_any(path, include):
+        return False
+    return not (exclude and _matches_any(path, exclude))
+
+def _matches_any(path, patterns):
+    """Return True if the path or its file name matches any glob pattern."""
+    path = path.replace(os.sep, "/")
+    name = path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def split_threads(workers=None):
+    """Split the CPUs between concurrent workers and ONNX intra-op threads.
+    
+    Returns (workers, intra-op threads) with workers defaulting to the CPU
+    count, so workers times intra-op threads never exceeds the cores.
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or cpus
+    return workers, max(1, cpus // workers)
+
+def autotune_threads(sample_paths, model_name="u2net", options=None, profile_path=None):
+    """Find the fastest mix of workers and intra-op threads for this machine.
+    
+    Each candidate split of the CPUs processes the sample images with the
+    thread executor. The winning profile is cached in profile_path (by
+    default under ~/.cache/bg_remover) per model, machine and fast mode,
+    and returned straight from there on later calls.
+    """
+    options = dict(options or {})
+    profile_path = profile_path or _autotune_profile_path()
+    cpus = os.cpu_count() or 1
+    key = f"{model_name}/{platform.machine()}/{cpus}/{'fast' if options.get('fast') else 'full'}"
+    
+    profiles = {}
+    try:
+        with open(profile_path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if key in profiles:
+        return profiles[key]
+    
+    sample_paths = [str(path) for path in sample_paths]
+    if not sample_paths:
+        raise ValueError("Autotuning needs at least one sample image")
     
-    return image_files
+    _import_runtime()
+    candidates = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workers = 1
+        while True:
+            workers, intra_op_threads = split_threads(min(workers, cpus))
+            # A private registry keeps one candidate session resident at a time
+            remover = SmartBgRemover(model_name, registry=SessionRegistry(max_models=1),
+                                     intra_op_threads=intra_op_threads, inter_op_threads=1)
+            
+            # Load the session and warm it up outside the timed run
+            success, result = remover.remove_background(sample_paths[0], os.path.join(tmp, "warmup.png"),
+                                                        **options)
+            if not success:
+                raise RuntimeError(result)
+            
+            # Enough images to keep every worker busy at least twice
+            jobs = list(itertools.islice(itertools.cycle(sample_paths), max(len(sample_paths), 2 * workers)))
+            start = time.perf_counter()
+            for record in remover.iter_process(jobs, output_dir=tmp, max_workers=workers, **options):
+                if not record["success"]:
+                    raise RuntimeError(record["result"])
+            candidates.append({
+                "workers": workers,
+                "intra_op_threads": intra_op_threads,
+                "inter_op_threads": 1,
+                "images_per_second": len(jobs) / (time.perf_counter() - start),
+            })
+            
+            if workers >= cpus:
+                break
+            workers *= 2
+    
+    profile = max(candidates, key=lambda candidate: candidate["images_per_second"])
+    profiles[key] = profile
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    tmp_path = f"{profile_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp_path, profile_path)
+    return profile
+
+def _autotune_profile_path():
+    """Default location of the cached autotuning profiles."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "bg_remover", "autotune.json")
+
+def default_socket_path():
+    """Unix socket the daemon listens on; override with BG_REMOVER_SOCKET."""
+    if os.environ.get("BG_REMOVER_SOCKET"):
+        return os.environ["BG_REMOVER_SOCKET"]
+    # XDG_RUNTIME_DIR is private to the user, so nobody else can plant a socket there
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "bg_remover.sock")
+    return os.path.join(tempfile.gettempdir(), f"bg_remover-{os.getuid()}.sock")
+
+def _peer_uid(sock):
+    """Return the uid of the process on the other end of a Unix socket, or None if unknown."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+def _connect_daemon(path):
+    """Connect to a running daemon, or return None to process standalone."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    # Refuse a socket another user created, e.g. planted in a shared temp directory
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            print(f"Warning: ignoring daemon socket {path} owned by another user")
+            return None
+    except OSError:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        peer_uid = _peer_uid(sock)
+    except OSError:
+        sock.close()
+        return None
+    if peer_uid is not None and peer_uid != os.getuid():
+        print(f"Warning: ignoring daemon on {path} run by another user")
+        sock.close()
+        return None
+    return sock
+
+def _iter_daemon_records(sock, input_paths, request):
+    """Send a job and its input paths to the daemon and yield its result records."""
+    def send_paths():
+        with contextlib.suppress(OSError):
+            for path in input_paths:
+                writer.write(json.dumps(str(path)) + "\n")
+            writer.flush()
+            # End of input; the daemon finishes in-flight images and hangs up
+            sock.shutdown(socket.SHUT_WR)
+    
+    # Paths are sent from a separate thread so neither side blocks on a full socket buffer
+    writer = sock.makefile("w", encoding="utf-8")
+    reader = sock.makefile("r", encoding="utf-8")
+    writer.write(json.dumps(request) + "\n")
+    sender = threading.Thread(target=send_paths, daemon=True)
+    sender.start()
+    try:
+        for line in reader:
+            record = json.loads(line)
+            if "error" in record:
+                raise RuntimeError(f"Daemon error: {record['error']}")
+            yield record
+        sender.join()
+    finally:
+        sock.close()
 
 def main():
+    # Subcommands are dispatched before parsing so plain input paths keep working
+    if sys.argv[1:2] == ["serve"]:
+        from bg_remover_server import serve_main
+        return serve_main(sys.argv[2:])
+    if sys.argv[1:2] == ["daemon"]:
+        from bg_remover_daemon import daemon_main
+        return daemon_main(sys.argv[2:])
+    if sys.argv[1:2] == ["merge"]:
+        return merge_main(sys.argv[2:])
+    
     parser = argparse.ArgumentParser(description="Smart Background Remover")
-    parser.add_argument("inputs", nargs="+", help="Input image files or directories")
+    parser.add_argument("inputs", nargs="*", help="Input image files or directories")
+    parser.add_argument("--sequence", action="store_true",
+                        help="Treat each input as an ordered frame sequence (a directory of frames, "
+                             "an animated GIF or a multi-page TIFF) and reuse masks between keyframes")
+    parser.add_argument("--keyframe-interval", type=int, default=10,
+                        help="Maximum number of frames that reuse a keyframe's mask in --sequence mode")
+    parser.add_argument("--diff-threshold", type=float, default=2.0,
+                        help="Mean thumbnail difference (0-255) above which a frame becomes a new keyframe")
+    parser.add_argument("--files-from", metavar="FILE",
+                        help="Read input image paths from a text file, one per line ('-' for stdin)")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Only process files matching this glob (repeatable)")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip files and directories matching this glob (repeatable)")
+    parser.add_argument("--scan-workers", type=int, default=1,
+                        help="Threads used to walk input directories")
     parser.add_argument("-o", "--output-dir", help="Output directory for processed images")
     parser.add_argument("-s", "--suffix", default="_nobg", help="Suffix to add to output filenames")
     parser.add_argument("-m", "--model", default="u2net", 
@@ -114,42 +2589,547 @@ def main():
                         help="Model to use for background removal")
     parser.add_argument("-a", "--alpha-matting", action="store_true", 
                         help="Enable alpha matting for better edge detection")
+    parser.add_argument("--matting", choices=["pymatting", "fast"],
+                        help="Alpha matting engine: pymatting (closed-form) or fast (guided filter "
+                             "on the edge band); implies --alpha-matting")
+    parser.add_argument("--fast", action="store_true",
+                        help="Run the model on a reduced-size decode and upsample only the mask")
+    parser.add_argument("--max-pixels", type=int, default=None,
+                        help="Per-image pixel budget; larger images are masked and written in strips")
+    parser.add_argument("--format", choices=["png", "webp", "mask"], default="png",
+                        help="Output format: transparent PNG, WebP with alpha, or a grayscale mask PNG (default: png)")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=6, metavar="0-9",
+                        help="PNG compression level; lower is faster with larger files (default: 6)")
+    parser.add_argument("--webp-quality", type=int, default=90,
+                        help="WebP quality 0-100, or compression effort with --webp-lossless (default: 90)")
+    parser.add_argument("--webp-lossless", action="store_true",
+                        help="Write lossless WebP")
+    parser.add_argument("--crop", action="store_true",
+                        help="Crop each result to the bounding box of the subject")
     parser.add_argument("--workers", type=int, default=None, 
-                        help="Number of worker threads (defaults to CPU count)")
+                        help="Number of worker threads or processes (defaults to CPU count)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Number of images to run through the model in one forward pass")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Maximum number of images queued or processing at once")
+    parser.add_argument("--schedule", choices=["input", "largest-first"], default="input",
+                        help="Processing order: as discovered, or largest images first (reads every "
+                             "image header up front) so big images do not finish last")
+    parser.add_argument("--max-in-flight-pixels", type=int, default=None,
+                        help="Maximum total pixels of the images processing at once, so several giant "
+                             "images never run together")
+    parser.add_argument("--cache-dir",
+                        help="Directory for a result cache keyed on image content, model and settings")
+    parser.add_argument("--cache-max-bytes", type=int, default=1024 ** 3,
+                        help="Maximum size of the result cache before least recently used entries are evicted")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Record results in a manifest in the output directory and skip inputs already done")
+    parser.add_argument("--manifest",
+                        help="Manifest file for --incremental (defaults to bg_remover_manifest.jsonl in the output directory)")
+    parser.add_argument("--shard-index", type=int, default=None,
+                        help="Process only this shard (0-based) of the inputs; use with --shard-count")
+    parser.add_argument("--shard-count", type=int, default=None,
+                        help="Split the inputs into this many shards by a stable hash of their paths, "
+                             "so identical commands on different machines divide the work")
+    parser.add_argument("--executor", default="thread", choices=["thread", "process", "pipeline"],
+                        help="Run workers as threads sharing one model, as processes with one model each, "
+                             "or as separate decode/inference/encode stages")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                        help="Decode threads for the pipeline executor (--workers sets inference threads)")
+    parser.add_argument("--encode-workers", type=int, default=2,
+                        help="Encode threads for the pipeline executor")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Capacity of each queue between pipeline stages")
+    parser.add_argument("--intra-op-threads", type=int, default=None,
+                        help="ONNX Runtime threads per inference (default: CPU count divided by workers)")
+    parser.add_argument("--inter-op-threads", type=int, default=None,
+                        help="ONNX Runtime threads for running independent graph nodes in parallel (default: 1)")
+    parser.add_argument("--autotune", action="store_true",
+                        help="Calibrate workers and intra-op threads on the first inputs and cache the "
+                             "best profile for this machine in ~/.cache/bg_remover")
+    parser.add_argument("--socket", default=None,
+                        help="Unix socket of a running daemon (default: $BG_REMOVER_SOCKET, else $XDG_RUNTIME_DIR/bg_remover.sock)")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Always process in this process, even if a daemon is running")
+    parser.add_argument("--metrics-json", metavar="FILE", default=None,
+                        help="Write per-stage timings (p50/p95/p99), throughput and peak memory to FILE")
+    parser.add_argument("--dedup", choices=["exact", "perceptual"], default=None,
+                        help="Run the model once per group of identical inputs (exact), or also of "
+                             "resized and re-encoded copies (perceptual), reusing the result for the rest")
+    parser.add_argument("--dedup-distance", type=int, default=2,
+                        help="Maximum differing bits (of 64) between perceptual hashes of duplicates (default: 2)")
+    parser.add_argument("--output-shards", metavar="PREFIX", default=None,
+                        help="Write outputs into rolling tar shards PREFIX-00000.tar, ... with an index "
+                             "PREFIX-index.jsonl instead of one file per image")
+    parser.add_argument("--shard-max-bytes", type=int, default=1024 ** 3,
+                        help="Start a new output shard before one grows past this size (default: 1 GiB)")
+    parser.add_argument("--shard-max-count", type=int, default=10000,
+                        help="Maximum number of outputs per shard (default: 10000)")
     
     args = parser.parse_args()
+    if args.sequence and not args.inputs:
+        parser.error("--sequence needs input directories or multi-frame files")
+    if not args.inputs and not args.files_from:
+        parser.error("specify input files or directories, or --files-from")
+    
+    # Stream image files from the input paths so processing starts with the first one found
+    image_files = iter_image_files(args.inputs, include=args.include, exclude=args.exclude,
+                                   workers=args.scan_workers)
+    if args.files_from:
+        image_files = itertools.chain(
+            image_files,
+            iter_listed_files(args.files_from, include=args.include, exclude=args.exclude)
+        )
+    
+    # Settings that affect the output; recorded in the manifest and passed to the remover
+    options = {
+        "alpha_matting": args.alpha_matting or args.matting is not None,
+        "matting": args.matting or "pymatting",
+        "fast": args.fast,
+        "max_pixels": args.max_pixels,
+        "output_format": args.format,
+        "png_compress_level": args.png_level,
+        "webp_quality": args.webp_quality,
+        "webp_lossless": args.webp_lossless,
+        "crop": args.crop,
+    }
+    params = dict(_PROCESSING_DEFAULTS, **options)
     
-    # Find all image files in the input paths
-    image_files = find_image_files(args.inputs)
+    # Stage timings are only collected when requested
+    metrics = StageMetrics() if args.metrics_json else None
     
-    if not image_files:
-        print("No image files found in the specified paths.")
+    if (args.shard_index is None) != (args.shard_count is None):
+        parser.error("--shard-index and --shard-count must be used together")
+    if args.shard_count is not None and not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be at least 0 and less than --shard-count")
+    if args.shard_count is not None and args.sequence:
+        parser.error("--shard-count cannot be used with --sequence")
+    
+    if args.dedup == "perceptual" and args.executor != "thread":
+        parser.error("--dedup perceptual needs the thread executor")
+    if args.dedup and args.executor == "pipeline":
+        parser.error("--dedup cannot be used with the pipeline executor")
+    if args.executor == "pipeline" and (args.schedule != "input" or args.max_in_flight_pixels):
+        parser.error("--schedule and --max-in-flight-pixels cannot be used with the pipeline executor")
+    if args.autotune and args.executor != "thread":
+        parser.error("--autotune calibrates the thread executor")
+    if args.autotune and args.sequence:
+        parser.error("--autotune cannot be used with --sequence")
+    
+    if args.sequence:
+        _run_sequences(args, options, metrics)
         return
     
-    print(f"Found {len(image_files)} image files to process.")
+    # Archive inputs and shard outputs are read and written in memory, never unpacked to disk
+    if args.output_shards or any(_is_archive_name(path) and os.path.isfile(path) for path in args.inputs):
+        if args.incremental or args.manifest:
+            parser.error("--incremental cannot be used with archive inputs or --output-shards")
+        if args.max_pixels is not None:
+            parser.error("--max-pixels cannot be used with archive inputs or --output-shards")
+        if args.executor != "thread":
+            parser.error("archive inputs and --output-shards use the thread executor")
+        if args.dedup:
+            parser.error("--dedup cannot be used with archive inputs or --output-shards")
+        if args.autotune:
+            parser.error("--autotune cannot be used with archive inputs or --output-shards")
+        if args.shard_count is not None:
+            parser.error("--shard-count cannot be used with archive inputs or --output-shards")
+        if args.schedule != "input" or args.max_in_flight_pixels:
+            parser.error("--schedule and --max-in-flight-pixels cannot be used with archive inputs "
+                         "or --output-shards")
+        _run_shards(args, options, image_files, metrics)
+        return
     
-    # Initialize the background remover
-    remover = SmartBgRemover(model_name=args.model)
+    # Keep only this node's share of the inputs
+    if args.shard_count is not None:
+        image_files = (
+            path for path in image_files
+            if _shard_of(path, args.shard_count) == args.shard_index
+        )
     
-    # Process the images
-    results = remover.process_batch(
-        image_files,
-        output_dir=args.output_dir,
-        output_suffix=args.suffix,
-        max_workers=args.workers,
-        alpha_matting=args.alpha_matting
-    )
+    # Skip inputs whose outputs from an earlier run are still valid
+    manifest = None
+    skipped_count = 0
+    if args.incremental or args.manifest or args.shard_count is not None:
+        manifest_path = args.manifest or Path(args.output_dir or ".") / "bg_remover_manifest.jsonl"
+        if args.shard_count is not None:
+            # Each shard logs separately; `bg_remover.py merge` combines the logs
+            manifest_path = _shard_manifest_path(manifest_path, args.shard_index, args.shard_count)
+        manifest = Manifest(manifest_path)
+        
+        def is_pending(path):
+            nonlocal skipped_count
+            if manifest.is_done(path, _output_path(path, args.output_dir, args.suffix, args.format), args.model, params):
+                skipped_count += 1
+                return False
+            return True
+        
+        image_files = filter(is_pending, image_files)
+    
+    if metrics is not None:
+        image_files = metrics.iter_timed("discovery", image_files)
     
+    # Look ahead one file so an empty run exits before the model is loaded
+    first_file = next(image_files, None)
+    if first_file is None:
+        if skipped_count:
+            print(f"All {skipped_count} images were already processed.")
+        else:
+            print("No image files found in the specified paths.")
+        if metrics is not None:
+            # A zero-image report, so scripts reading it need no special case
+            _write_metrics(args.metrics_json, metrics, 0, 0)
+        return
+    image_files = itertools.chain([first_file], image_files)
+    
+    # Give each worker its share of the cores instead of every inference using all of them
+    if args.executor == "pipeline":
+        workers, intra_op_threads = split_threads(args.workers or 1)
+    else:
+        workers, intra_op_threads = split_threads(args.workers)
+    inter_op_threads = 1
+    if args.autotune:
+        # Calibrate on the first few inputs, then process them as usual
+        samples = [first_file] + list(itertools.islice(image_files, 1, 8))
+        image_files = itertools.chain(samples, image_files)
+        profile = autotune_threads(samples, args.model, options)
+        workers = profile["workers"]
+        intra_op_threads = profile["intra_op_threads"]
+        inter_op_threads = profile["inter_op_threads"]
+        print(f"Autotuned: {workers} workers x {intra_op_threads} intra-op threads "
+              f"({profile['images_per_second']:.2f} images/s in calibration)")
+    # Explicit settings override the defaults and the tuned profile
+    workers = args.workers or workers
+    intra_op_threads = args.intra_op_threads or intra_op_threads
+    inter_op_threads = args.inter_op_threads or inter_op_threads
+    
+    # Hand the images to a running daemon, which already has the model loaded
+    sock = None
+    # The daemon's stage timings and duplicate counts stay in the daemon, so
+    # --metrics-json and --dedup run locally
+    duplicates = None
+    if args.dedup:
+        duplicates = DuplicateIndex(perceptual=args.dedup == "perceptual",
+                                    max_distance=args.dedup_distance)
+    if (not args.no_daemon and args.executor == "thread" and metrics is None
+            and duplicates is None):
+        sock = _connect_daemon(args.socket or default_socket_path())
+    
+    # Process the images, streaming the summary as results complete
+    pipeline = None
+    if sock is not None:
+        records = _iter_daemon_records(sock, image_files, {
+            "cwd": os.getcwd(),
+            "model": args.model,
+            "output_dir": args.output_dir,
+            "suffix": args.suffix,
+            "options": options,
+            # The daemon keys its sessions on the thread split, as a local run would
+            "workers": workers,
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "batch_size": args.batch_size,
+            "max_in_flight": args.max_in_flight,
+            "schedule": args.schedule,
+            "max_in_flight_pixels": args.max_in_flight_pixels,
+            "cache_dir": args.cache_dir,
+            "cache_max_bytes": args.cache_max_bytes,
+        })
+    else:
+        # Initialize the background remover
+        cache = ResultCache(args.cache_dir, args.cache_max_bytes) if args.cache_dir else None
+        remover = SmartBgRemover(model_name=args.model, cache=cache, metrics=metrics,
+                                 intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+        
+        if args.executor == "pipeline":
+            pipeline = StagedPipeline(
+                remover,
+                decode_workers=args.decode_workers,
+                infer_workers=workers,
+                encode_workers=args.encode_workers,
+                queue_size=args.queue_size,
+                batch_size=args.batch_size
+            )
+            records = pipeline.run(
+                image_files,
+                output_dir=args.output_dir,
+                output_suffix=args.suffix,
+                **options
+            )
+        else:
+            records = remover.iter_process(
+                image_files,
+                output_dir=args.output_dir,
+                output_suffix=args.suffix,
+                max_workers=workers,
+                executor=args.executor,
+                batch_size=args.batch_size,
+                max_in_flight=args.max_in_flight,
+                duplicates=duplicates,
+                schedule=args.schedule,
+                max_in_flight_pixels=args.max_in_flight_pixels,
+                **options
+            )
+    
+    processed_count = 0
+    success_count = 0
+    failures = []
+    progress = tqdm.tqdm(records, desc="Removing backgrounds")
+    try:
+        for record in progress:
+            processed_count += 1
+            if record["success"]:
+                success_count += 1
+            else:
+                failures.append(record)
+            
+            if manifest is not None:
+                manifest.record(
+                    record["input"],
+                    _output_path(record["input"], args.output_dir, args.suffix, args.format),
+                    args.model,
+                    params,
+                    record["success"],
+                    error=None if record["success"] else record["result"]
+                )
+            
+            # Show which stage the work is piling up in front of
+            if pipeline is not None:
+                progress.set_postfix(pipeline.queue_depths(), refresh=False)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
     # Print summary
-    success_count = sum(1 for r in results if r["success"])
-    print(f"\nProcessed {len(results)} images: {success_count} successful, {len(results) - success_count} failed")
+    print(f"\nProcessed {processed_count} images: {success_count} successful, {len(failures)} failed")
+    if args.shard_count is not None:
+        print(f"Shard {args.shard_index} of {args.shard_count}; results recorded in {manifest.path}")
+    if skipped_count:
+        print(f"Skipped {skipped_count} images already processed.")
+    if duplicates is not None:
+        saved = duplicates.stats()
+        print(f"Saved {saved['inferences_saved']} inferences on duplicates "
+              f"({saved['exact']} exact, {saved['perceptual']} perceptual)")
+    
+    if pipeline is not None:
+        depths = ", ".join(f"{name}={depth}" for name, depth in pipeline.peak_queue_depths().items())
+        print(f"Peak queue depths: {depths}")
     
     # Print failures if any
-    failures = [r for r in results if not r["success"]]
     if failures:
         print("\nFailed images:")
         for failure in failures:
             print(f"- {failure['input']}: {failure['result']}")
+    
+    if metrics is not None:
+        _write_metrics(args.metrics_json, metrics, processed_count, success_count)
+
+def merge_main(argv=None):
+    """Entry point for `bg_remover.py merge`: combine shard manifests into one summary."""
+    parser = argparse.ArgumentParser(prog="bg_remover.py merge",
+                                     description="Combine the results manifests of sharded runs")
+    parser.add_argument("manifests", nargs="+",
+                        help="Manifest files, or directories holding bg_remover_manifest*.jsonl files")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the combined manifest here, usable with --incremental --manifest")
+    
+    args = parser.parse_args(argv)
+    
+    paths = []
+    for path in args.manifests:
+        if os.path.isdir(path):
+            paths.extend(sorted(str(p) for p in Path(path).glob("bg_remover_manifest*.jsonl")))
+        elif os.path.isfile(path):
+            paths.append(path)
+        else:
+            parser.error(f"no such manifest: {path}")
+    if not paths:
+        parser.error("no manifests found")
+    
+    # An input recorded by several shards or runs counts once; any success wins
+    entries = {}
+    for path in paths:
+        for input_path, entry in Manifest(path).entries.items():
+            previous = entries.get(input_path)
+            if previous is None or entry["success"] or not previous["success"]:
+                entries[input_path] = entry
+    
+    failures = [entry for entry in entries.values() if not entry["success"]]
+    print(f"Merged {len(paths)} manifests: {len(entries)} images, "
+          f"{len(entries) - len(failures)} successful, {len(failures)} failed")
+    
+    # Print failures if any
+    if failures:
+        print("\nFailed images:")
+        for entry in failures:
+            print(f"- {entry['input']}: {entry.get('error')}")
+    
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry) + "\n")
+    return 1 if failures else 0
+
+def _write_metrics(path, metrics, processed_count, success_count):
+    """Write the run's metrics summary as JSON and print the slowest stage."""
+    report = metrics.summary(processed_count)
+    report["successful"] = success_count
+    report["failed"] = processed_count - success_count
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    
+    if report["stages"]:
+        slowest = max(report["stages"], key=lambda stage: report["stages"][stage]["total_seconds"])
+        print(f"Metrics written to {path} (most time spent in {slowest})")
+
+def _run_shards(args, options, image_files, metrics=None):
+    """Process archive members and loose files in memory, writing to shards or files."""
+    # Destination of each pending input, keyed by its display name
+    targets = {}
+    # Inputs that could not be read or safely named never reach the remover
+    input_failures = []
+    
+    def iter_items():
+        for path in args.inputs:
+            if not (_is_archive_name(path) and os.path.isfile(path)):
+                continue
+            # Each archive gets its own folder, so archives holding the same names never collide
+            stem = _archive_stem(path)
+            for member, data in iter_archive_members(path, include=args.include, exclude=args.exclude):
+                name = f"{path}:{member}"
+                relative = _safe_member_name(member)
+                if relative is None:
+                    input_failures.append(_failure(name, ValueError("unsafe member name")))
+                    continue
+                relative = f"{stem}/{relative}"
+                if args.output_shards:
+                    target = _output_path(relative, None, args.suffix, args.format)
+                else:
+                    # Members keep their archive layout under the output directory
+                    output_dir = Path(args.output_dir or os.path.dirname(os.path.abspath(path)))
+                    target = _output_path(output_dir / relative, None, args.suffix, args.format)
+                targets.setdefault(name, []).append(target)
+                yield name, data
+        
+        for path in image_files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                input_failures.append(_failure(path, e))
+                continue
+            if args.output_shards:
+                # Loose files are named relative to the working directory, or by their
+                # base name when they live outside it
+                relative = os.path.relpath(path)
+                if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+                    relative = os.path.basename(path)
+                target = _output_path(relative.replace(os.sep, "/"), None, args.suffix, args.format)
+            else:
+                target = _output_path(path, args.output_dir, args.suffix, args.format)
+            targets.setdefault(path, []).append(target)
+            yield path, data
+    
+    items = iter_items()
+    if metrics is not None:
+        items = metrics.iter_timed("discovery", items, key=lambda item: item[0])
+    
+    workers, intra_op_threads = split_threads(args.workers)
+    remover = SmartBgRemover(model_name=args.model, metrics=metrics,
+                             intra_op_threads=args.intra_op_threads or intra_op_threads,
+                             inter_op_threads=args.inter_op_threads or 1)
+    writer = None
+    if args.output_shards:
+        writer = ShardWriter(args.output_shards, args.shard_max_bytes, args.shard_max_count)
+    
+    kwargs = {key: value for key, value in options.items() if key != "max_pixels"}
+    records = remover.iter_process_bytes(items, max_workers=workers,
+                                         max_in_flight=args.max_in_flight, **kwargs)
+    
+    processed_count = 0
+    failures = []
+    try:
+        for record in tqdm.tqdm(records, desc="Removing backgrounds"):
+            processed_count += 1
+            # Inputs can repeat (tar members, files listed twice); the same name always has the same target
+            target = targets[record["input"]].pop()
+            if not targets[record["input"]]:
+                del targets[record["input"]]
+            if not record["success"]:
+                failures.append(record)
+                continue
+            
+            try:
+                with remover._timed("write", record["input"]):
+                    if writer is not None:
+                        writer.add(record["input"], target, record["result"])
+                    else:
+                        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                        with open(target, "wb") as f:
+                            f.write(record["result"])
+            except Exception as e:
+                failures.append(_failure(record["input"], e))
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    processed_count += len(input_failures)
+    failures = input_failures + failures
+    
+    # Print summary
+    success_count = processed_count - len(failures)
+    print(f"\nProcessed {processed_count} images: {success_count} successful, {len(failures)} failed")
+    if writer is not None:
+        print(f"Wrote {writer.member_count} outputs to {writer.shard_count} shards, indexed in {writer.index_path}")
+    
+    # Print failures if any
+    if failures:
+        print("\nFailed images:")
+        for failure in failures:
+            print(f"- {failure['input']}: {failure['result']}")
+    
+    if metrics is not None:
+        _write_metrics(args.metrics_json, metrics, processed_count, success_count)
+
+def _run_sequences(args, options, metrics=None):
+    """Process each input as an ordered frame sequence and print a summary."""
+    # Frames are processed one at a time, so inference keeps every core by default
+    remover = SmartBgRemover(model_name=args.model, metrics=metrics,
+                             intra_op_threads=args.intra_op_threads,
+                             inter_op_threads=args.inter_op_threads)
+    
+    frame_count = 0
+    keyframe_count = 0
+    failures = []
+    for source in args.inputs:
+        records = remover.iter_sequence(
+            source,
+            output_dir=args.output_dir,
+            output_suffix=args.suffix,
+            keyframe_interval=args.keyframe_interval,
+            diff_threshold=args.diff_threshold,
+            **options
+        )
+        for record in tqdm.tqdm(records, desc=f"Frames of {os.path.basename(os.path.normpath(source))}"):
+            frame_count += 1
+            if record["keyframe"]:
+                keyframe_count += 1
+            if not record["success"]:
+                failures.append(record)
+    
+    # Print summary
+    print(f"\nProcessed {frame_count} frames: {frame_count - len(failures)} successful, {len(failures)} failed")
+    print(f"Ran inference on {keyframe_count} keyframes and reused masks for {frame_count - keyframe_count - len(failures)} frames")
+    
+    # Print failures if any
+    if failures:
+        print("\nFailed frames:")
+        for failure in failures:
+            print(f"- {failure['input']}: {failure['result']}")
+    
+    if metrics is not None:
+        _write_metrics(args.metrics_json, metrics, frame_count, frame_count - len(failures))
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Smart Background Remover
+Measures CLI startup cost and, with a deterministic stub model, the I/O and
+pre/post-processing overhead of the removal pipeline.
+"""
+
+import os
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+# Modules that must not be loaded by a bare `import bg_remover`
+HEAVY_MODULES = ("rembg", "onnxruntime", "numpy", "PIL", "tqdm", "scipy", "pymatting")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_command(command, runs):
+    """Run a command repeatedly and return the median wall time in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def loaded_heavy_modules():
+    """Return the heavy modules a fresh interpreter has loaded after `import bg_remover`."""
+    probe = (
+        "import sys, json, bg_remover; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    output = subprocess.run([sys.executable, "-c", probe], cwd=SCRIPT_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def bench_startup(runs):
+    """Time interpreter startup, module import and --help against an eager rembg import."""
+    script = os.path.join(SCRIPT_DIR, "bg_remover.py")
+    return {
+        "runs": runs,
+        "python_ms": time_command([sys.executable, "-c", "pass"], runs),
+        "import_ms": time_command([sys.executable, "-c", "import bg_remover"], runs),
+        "help_ms": time_command([sys.executable, script, "--help"], runs),
+        "eager_rembg_import_ms": time_command([sys.executable, "-c", "import rembg"], runs),
+        "heavy_modules_loaded": loaded_heavy_modules(),
+    }
+
+
+class _StubInput:
+    name = "input.image"
+
+
+class _StubInner:
+    """Stands in for the onnxruntime session: a cheap, deterministic per-pixel mask."""
+
+    def get_inputs(self):
+        return [_StubInput()]
+
+    def run(self, output_names, feed):
+        import numpy as np
+        batch = feed[_StubInput.name]
+        # Smooth function of brightness, shaped like the model's (N, 1, H, W) output
+        return [1 / (1 + np.exp(-4 * batch.mean(axis=1, keepdims=True)))]
+
+
+class StubSession:
+    """Deterministic replacement for a rembg session, so no model is downloaded or run."""
+
+    def __init__(self, model_name="stub"):
+        self.model_name = model_name
+        self.inner_session = _StubInner()
+
+    def normalize(self, img, mean, std, size):
+        """Preprocess like rembg so resizing and normalization costs are still measured."""
+        import numpy as np
+        from PIL import Image
+        im = np.asarray(img.convert("RGB").resize(size, Image.LANCZOS), dtype=np.float32) / 255
+        im = (im - np.array(mean, dtype=np.float32)) / np.array(std, dtype=np.float32)
+        return {_StubInput.name: im.transpose(2, 0, 1)[None]}
+
+    def predict(self, img):
+        from PIL import Image
+        return [img.convert("L").resize(img.size, Image.BILINEAR)]
+
+
+def make_image(size, seed=0):
+    """Build a deterministic photo-like RGB image: a gradient with a soft foreground blob."""
+    import numpy as np
+    from PIL import Image
+    width, height = size
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    background = np.stack([x / width, y / height, 1 - x / width], axis=-1) * 160
+    distance = np.hypot((x - width / 2) / width, (y - height / 2) / height)
+    foreground = (distance < 0.3)[..., None] * rng.uniform(60, 90, 3)
+    noise = rng.normal(0, 6, (height, width, 3))
+    return Image.fromarray(np.clip(background + foreground + noise, 0, 255).astype("uint8"))
+
+
+def write_images(directory, size, fmt, count):
+    """Write count synthetic images in the given format and return their paths."""
+    extension = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}[fmt]
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{size[0]}x{size[1]}_{i}{extension}")
+        make_image(size, seed=i).save(path, format=fmt)
+        paths.append(path)
+    return paths
+
+
+def make_tree(root, file_count, files_per_dir=100, depth=3):
+    """Create a nested directory tree of empty image (and some non-image) files."""
+    for i in range(file_count):
+        parts = [f"d{(i // files_per_dir) % 10 ** (level + 1) // 10 ** level}" for level in range(depth)]
+        directory = os.path.join(root, *parts)
+        os.makedirs(directory, exist_ok=True)
+        extension = ".txt" if i % 10 == 0 else ".jpg"
+        open(os.path.join(directory, f"f{i}{extension}"), "wb").close()
+
+
+def measure(func, repeat):
+    """Call func repeat times (after one warm-up call) and summarize the timings in ms."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "repeat": repeat,
+    }
+
+
+def make_remover(model_name, real_model):
+    """Create a remover backed by the stub session unless the real model is requested."""
+    from bg_remover import SessionRegistry, SmartBgRemover
+    if real_model:
+        return SmartBgRemover(model_name=model_name, registry=SessionRegistry())
+    registry = SessionRegistry(loader=StubSession)
+    return SmartBgRemover(model_name=model_name, registry=registry)
+
+
+def bench_remove_background(workdir, remover, sizes, formats, repeat):
+    """Time remove_background for each image size and input format."""
+    results = []
+    for size in sizes:
+        for fmt in formats:
+            path = write_images(workdir, size, fmt, 1)[0]
+            output_path = os.path.join(workdir, "out", f"{os.path.basename(path)}.png")
+            timing = measure(lambda: remover.remove_background(path, output_path), repeat)
+            results.append(dict(timing, benchmark="remove_background",
+                                size=f"{size[0]}x{size[1]}", format=fmt))
+    return results
+
+
+def bench_process_batch(workdir, remover, size, count, worker_counts, repeat):
+    """Time process_batch over the same images with different worker counts."""
+    input_dir = os.path.join(workdir, "batch")
+    os.makedirs(input_dir, exist_ok=True)
+    paths = write_images(input_dir, size, "PNG", count)
+    output_dir = os.path.join(workdir, "batch_out")
+
+    results = []
+    for workers in worker_counts:
+        def run():
+            with open(os.devnull, "w") as devnull:
+                # Keep the progress bar out of the measurement output
+                stderr, sys.stderr = sys.stderr, devnull
+                try:
+                    records = remover.process_batch(paths, output_dir=output_dir, max_workers=workers)
+                finally:
+                    sys.stderr = stderr
+            # Failed images are fast, so they would silently inflate the throughput
+            failures = [record for record in records if not record["success"]]
+            if failures:
+                raise RuntimeError(failures[0]["result"])
+        timing = measure(run, repeat)
+        timing["images_per_second"] = count / (timing["median_ms"] / 1000)
+        results.append(dict(timing, benchmark="process_batch", workers=workers,
+                            images=count, size=f"{size[0]}x{size[1]}"))
+    return results
+
+
+def bench_find_image_files(workdir, file_count, repeat):
+    """Time image discovery on a synthetic directory tree."""
+    from bg_remover import find_image_files
+    root = os.path.join(workdir, "tree")
+    make_tree(root, file_count)
+    timing = measure(lambda: find_image_files([root]), repeat)
+    return [dict(timing, benchmark="find_image_files", files=file_count)]
+
+
+def bench_preview_resize(sizes, repeat):
+    """Time the GUI's resize_image_for_preview without creating any windows."""
+    try:
+        from bg_remover_ui import BgRemoverUI
+    except ImportError as e:
+        print(f"Skipping resize_image_for_preview: {e}")
+        return []
+
+    # Only the attributes the method reads; no Tk root is needed
+    container = types.SimpleNamespace(winfo_width=lambda: 1100, winfo_height=lambda: 600)
+    ui = types.SimpleNamespace(preview_container=container, zoom_level=1.5)
+    results = []
+    for size in sizes:
+        img = make_image(size)
+        for use_zoom in (False, True):
+            timing = measure(lambda: BgRemoverUI.resize_image_for_preview(ui, img, use_zoom), repeat)
+            results.append(dict(timing, benchmark="resize_image_for_preview",
+                                size=f"{size[0]}x{size[1]}", zoom=use_zoom))
+    return results
+
+
+def bench_suite(args):
+    """Run the pipeline benchmarks in a temporary directory."""
+    sizes = [(320, 240), (1280, 960)] if args.quick else [(320, 240), (1280, 960), (4000, 3000)]
+    formats = ["JPEG", "PNG", "WEBP"]
+    repeat = 1 if args.quick else args.repeat
+    remover = make_remover(args.model, args.real_model)
+
+    workdir = tempfile.mkdtemp(prefix="bg_remover_bench_")
+    try:
+        results = []
+        results += bench_remove_background(workdir, remover, sizes, formats, repeat)
+        results += bench_process_batch(workdir, remover, (1280, 960), args.batch_images,
+                                       args.workers, repeat)
+        results += bench_find_image_files(workdir, args.tree_files, repeat)
+        results += bench_preview_resize(sizes, repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": args.model if args.real_model else "stub",
+        "results": results,
+    }
+
+
+def print_suite(report):
+    """Print one line per benchmark result."""
+    for result in report["results"]:
+        details = ", ".join(
+            f"{key}={value}" for key, value in result.items()
+            if key not in ("benchmark", "median_ms", "min_ms", "max_ms", "repeat", "images_per_second")
+        )
+        line = f"{result['benchmark']:<26} {details:<40} {result['median_ms']:10.1f} ms"
+        if "images_per_second" in result:
+            line += f"  ({result['images_per_second']:.1f} images/s)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Smart Background Remover")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="Measure CLI import and --help latency")
+    startup.add_argument("--runs", type=int, default=5,
+                         help="Runs per measurement; the median is reported (default: 5)")
+    startup.add_argument("--max-import-ms", type=float, default=None,
+                         help="Exit with status 1 if importing bg_remover takes longer than this")
+    startup.add_argument("--json", dest="json_path", default=None,
+                         help="Also write the results to this JSON file")
+
+    suite = subparsers.add_parser("suite", help="Benchmark the removal pipeline on synthetic images")
+    suite.add_argument("--real-model", action="store_true",
+                       help="Run the real ONNX model instead of the deterministic stub session")
+    suite.add_argument("-m", "--model", default="u2net",
+                       choices=["u2net", "u2netp", "u2net_human_seg", "silueta"],
+                       help="Model whose preprocessing (and, with --real-model, weights) to use")
+    suite.add_argument("--repeat", type=int, default=3,
+                       help="Timed runs per benchmark after one warm-up run (default: 3)")
+    suite.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                       help="Worker counts for the process_batch benchmark (default: 1 2 4 8)")
+    suite.add_argument("--batch-images", type=int, default=32,
+                       help="Images per process_batch run (default: 32)")
+    suite.add_argument("--tree-files", type=int, default=20000,
+                       help="Files in the synthetic tree for find_image_files (default: 20000)")
+    suite.add_argument("--quick", action="store_true",
+                       help="Smaller images and a single timed run, for smoke testing")
+    suite.add_argument("--json", dest="json_path", default=None,
+                       help="Also write the results to this JSON file")
+
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        report = bench_suite(args)
+        print_suite(report)
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    results = bench_startup(args.runs)
+    print(f"python startup:          {results['python_ms']:8.1f} ms")
+    print(f"import bg_remover:       {results['import_ms']:8.1f} ms")
+    print(f"bg_remover.py --help:    {results['help_ms']:8.1f} ms")
+    print(f"import rembg (eager):    {results['eager_rembg_import_ms']:8.1f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    # Fail on anything a scheduler would pay for on every invocation
+    failed = False
+    if results["heavy_modules_loaded"]:
+        print(f"Heavy modules loaded at import: {', '.join(results['heavy_modules_loaded'])}")
+        failed = True
+    if args.max_import_ms is not None and results["import_ms"] > args.max_import_ms:
+        print(f"Import took {results['import_ms']:.1f} ms, over the {args.max_import_ms:.1f} ms limit")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Daemon mode for Smart Background Remover
+Keeps model sessions warm and serves the regular CLI over a Unix domain socket.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from bg_remover import (
+    ResultCache,
+    SmartBgRemover,
+    _import_runtime,
+    default_socket_path,
+    get_session_registry,
+    split_threads,
+)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Runs one CLI invocation: a JSON job line, then one JSON input path per line.
+
+    A JSON record is written back for each image as it completes; the
+    connection is closed once every input has been processed.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            # Older clients send no thread split; share the cores as the CLI would
+            workers, intra_op_threads = split_threads(request.get("workers"))
+            remover = SmartBgRemover(
+                model_name=request["model"],
+                cache=self.server.get_cache(request),
+                intra_op_threads=request.get("intra_op_threads") or intra_op_threads,
+                inter_op_threads=request.get("inter_op_threads") or 1
+            )
+        except Exception as e:
+            self._write({"error": str(e)})
+            return
+
+        # Relative paths are resolved against the client's working directory
+        cwd = request["cwd"]
+        output_dir = request["output_dir"]
+        if output_dir:
+            output_dir = os.path.join(cwd, output_dir)
+        given_paths = {}
+
+        def iter_inputs():
+            for line in self.rfile:
+                path = json.loads(line)
+                resolved = os.path.join(cwd, path)
+                given_paths[resolved] = path
+                yield resolved
+
+        records = remover.iter_process(
+            iter_inputs(),
+            output_dir=output_dir,
+            output_suffix=request["suffix"],
+            max_workers=workers,
+            batch_size=request["batch_size"],
+            max_in_flight=request["max_in_flight"],
+            schedule=request.get("schedule", "input"),
+            max_in_flight_pixels=request.get("max_in_flight_pixels"),
+            **request["options"]
+        )
+        try:
+            for record in records:
+                # Report inputs exactly as the client named them
+                record["input"] = given_paths.get(record["input"], record["input"])
+                self._write(record)
+        except OSError:
+            # The client went away; closing the generator cancels queued work
+            records.close()
+
+    def _write(self, record):
+        self.wfile.write(json.dumps(record).encode() + b"\n")
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server holding one result cache per cache directory."""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        """Listen on path, removing a stale socket left by a daemon that died."""
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)
+            else:
+                probe.close()
+                raise RuntimeError(f"A daemon is already listening on {path}")
+        super().__init__(path, DaemonHandler)
+        # Only the owner may submit work
+        os.chmod(path, 0o600)
+        self._caches = {}
+        self._caches_lock = threading.Lock()
+
+    def get_cache(self, request):
+        """Return the shared ResultCache for a request's cache directory, if any."""
+        if not request["cache_dir"]:
+            return None
+        cache_dir = os.path.join(request["cwd"], request["cache_dir"])
+        with self._caches_lock:
+            cache = self._caches.get(cache_dir)
+            if cache is None:
+                cache = ResultCache(cache_dir, request["cache_max_bytes"])
+                self._caches[cache_dir] = cache
+            return cache
+
+
+def daemon_main(argv=None):
+    """Entry point for `bg_remover.py daemon`."""
+    parser = argparse.ArgumentParser(prog="bg_remover.py daemon",
+                                     description="Keep models loaded for fast CLI invocations")
+    parser.add_argument("--socket", default=None,
+                        help="Unix socket to listen on (default: $BG_REMOVER_SOCKET, else $XDG_RUNTIME_DIR/bg_remover.sock)")
+    parser.add_argument("-m", "--model", action="append",
+                        choices=["u2net", "u2netp", "u2net_human_seg", "silueta"],
+                        help="Model to load at startup (repeatable; default: u2net)")
+    parser.add_argument("--max-models", type=int, default=4,
+                        help="Maximum number of models kept loaded at once")
+
+    args = parser.parse_args(argv)
+    path = args.socket or default_socket_path()
+
+    registry = get_session_registry()
+    registry.max_models = args.max_models
+    # Import and load on the main thread before any client connects
+    _import_runtime()
+    # Warm the sessions a default CLI run asks for
+    _, intra_op_threads = split_threads()
+    for model_name in args.model or ["u2net"]:
+        registry.get(model_name, intra_op_threads, 1)
+
+    server = DaemonServer(path)
+    print(f"Listening on {path} with {', '.join(registry.stats()['resident'])} loaded")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    daemon_main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+HTTP service mode for Smart Background Remover
+Keeps one model loaded and coalesces concurrent requests into batched inference.
+"""
+
+import argparse
+import collections
+import io
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from bg_remover import SmartBgRemover, _import_runtime, _percentile
+
+
+class MicroBatcher:
+    """Collects concurrent model inputs and runs them through the model together.
+    
+    Only the model call is serialized here; preprocessing and mask
+    upsampling stay in the request threads.
+    """
+
+    def __init__(self, remover, max_batch_size=8, max_wait_ms=10):
+        """Batch up to max_batch_size images, waiting at most max_wait_ms for a batch to fill."""
+        self.remover = remover
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_count = 0
+        self._batched_images = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def predict(self, model_input):
+        """Block until the raw prediction for one (input name, NCHW tensor) is ready.
+        
+        Model errors are re-raised here.
+        """
+        request = {"input": model_input, "done": threading.Event()}
+        self._requests.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["pred"]
+
+    def stats(self):
+        """Return the number of batches run and their mean size."""
+        with self._lock:
+            batches = self._batch_count
+            images = self._batched_images
+        return {
+            "batches": batches,
+            "mean_batch_size": images / batches if batches else 0.0,
+        }
+
+    def _run(self):
+        """Batching loop: wait for one request, then gather more until full or timed out."""
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                input_name = batch[0]["input"][0]
+                preds = self.remover._run_model(
+                    input_name,
+                    np.concatenate([request["input"][1] for request in batch], axis=0)
+                )
+                for request, pred in zip(batch, preds):
+                    request["pred"] = pred
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+
+            with self._lock:
+                self._batch_count += 1
+                self._batched_images += len(batch)
+            for request in batch:
+                request["done"].set()
+
+
+class LatencyMetrics:
+    """Request counters and a rolling window of latencies for percentile reporting."""
+
+    def __init__(self, window=10000):
+        """Keep the latencies of the most recent window requests."""
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._requests = 0
+        self._errors = 0
+
+    def observe(self, seconds, success=True):
+        """Record one finished request."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._requests += 1
+            if not success:
+                self._errors += 1
+
+    def snapshot(self):
+        """Return request counts and p50/p99 latency in milliseconds."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = {"requests": self._requests, "errors": self._errors}
+
+        for name, fraction in (("p50_ms", 0.50), ("p99_ms", 0.99)):
+            snapshot[name] = _percentile(latencies, fraction) * 1000 if latencies else None
+        return snapshot
+
+
+class RemoveHandler(BaseHTTPRequestHandler):
+    """POST /remove with image bytes; GET /metrics and /health for monitoring."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, b"ok\n", "text/plain")
+        elif path == "/metrics":
+            metrics = self.server.metrics.snapshot()
+            metrics.update(self.server.batcher.stats())
+            metrics["model"] = self.server.remover.model_name
+            self._send(200, json.dumps(metrics).encode() + b"\n", "application/json")
+        else:
+            self._send(404, b"Not found\n", "text/plain")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/remove":
+            self._send(404, b"Not found\n", "text/plain")
+            return
+
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length)
+            options = _parse_options(parse_qs(url.query))
+            body = self._remove(data, options)
+        except Exception as e:
+            self.server.metrics.observe(time.perf_counter() - start, success=False)
+            self._send(400, f"Error processing request: {str(e)}\n".encode(), "text/plain")
+            return
+
+        self.server.metrics.observe(time.perf_counter() - start)
+        self._send(200, body, "image/png")
+
+    def _remove(self, data, options):
+        """Decode, mask (batched with other requests), cut out and encode one image."""
+        remover = self.server.remover
+        img, proxy = remover._decode_for_model(io.BytesIO(data), options["fast"])
+        
+        # Only the model call is batched; resizing in and out runs on this thread
+        model_input = remover._model_input([proxy])
+        if model_input is not None:
+            pred = self.server.batcher.predict(model_input)
+        else:
+            pred = remover._predict_raw([proxy])[0]
+        mask = remover._predict_masks([img], [proxy], preds=[pred])[0]
+
+        if options["output"] == "mask":
+            result = mask
+        else:
+            result = remover._cutout(
+                img,
+                mask,
+                alpha_matting=options["alpha_matting"],
+                fast=options["fast"],
+                matting=options["matting"]
+            )
+
+        buffer = io.BytesIO()
+        result.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the cost of small images
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _parse_options(query):
+    """Read per-request options from the query string."""
+    def flag(name):
+        return query.get(name, ["0"])[-1].lower() in ("1", "true", "yes")
+
+    output = query.get("output", ["png"])[-1]
+    if output not in ("png", "mask"):
+        raise ValueError(f"output must be 'png' or 'mask', not {output!r}")
+    matting = query.get("matting", ["pymatting"])[-1]
+    if matting not in ("pymatting", "fast"):
+        raise ValueError(f"matting must be 'pymatting' or 'fast', not {matting!r}")
+    return {
+        "output": output,
+        "fast": flag("fast"),
+        "alpha_matting": flag("alpha_matting"),
+        "matting": matting,
+    }
+
+
+def serve_main(argv=None):
+    """Entry point for `bg_remover.py serve`."""
+    parser = argparse.ArgumentParser(prog="bg_remover.py serve",
+                                     description="Serve background removal over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("-m", "--model", default="u2net",
+                        choices=["u2net", "u2netp", "u2net_human_seg", "silueta"],
+                        help="Model to use (default: u2net)")
+    parser.add_argument("--max-batch-size", type=int, default=8,
+                        help="Maximum number of concurrent requests run through the model together")
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="How long the first request of a batch waits for others to join")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    args = parser.parse_args(argv)
+
+    remover = SmartBgRemover(model_name=args.model)
+    # Load the model before accepting requests so the first caller is not slow
+    _import_runtime()
+    remover.session
+
+    server = ThreadingHTTPServer((args.host, args.port), RemoveHandler)
+    server.daemon_threads = True
+    server.remover = remover
+    server.batcher = MicroBatcher(remover, args.max_batch_size, args.max_wait_ms)
+    server.metrics = LatencyMetrics()
+    server.verbose = args.verbose
+
+    print(f"Serving {args.model} on http://{args.host}:{server.server_address[1]} "
+          f"(POST /remove, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve_main()
@@ -4,6 +4,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image
 import rembg
+from bg_remover import get_session_registry
 from pathlib import Path
 import customtkinter as ctk
 import warnings
@@ -393,12 +394,24 @@ class BgRemoverUI:
     
     def initialize_model(self):
         """Initialize the background removal model in a separate thread"""
+        model_name = self.model_var.get()
+        registry = get_session_registry()
+        
+        # Switching back to a recently used model needs no reload
+        if registry.is_loaded(model_name):
+            self.session = registry.get(model_name)
+            self.status_var.set("Ready - Model loaded")
+            return
+        
         self.status_var.set("Loading model...")
         
         def load_model():
             try:
-                self.session = rembg.new_session(model_name=self.model_var.get())
-                self.root.after(0, lambda: self.status_var.set("Ready - Model loaded"))
+                session = registry.get(model_name)
+                # Ignore a slow load that finished after the user picked another model
+                if self.model_var.get() == model_name:
+                    self.session = session
+                    self.root.after(0, lambda: self.status_var.set("Ready - Model loaded"))
             except Exception as e:
                 self.root.after(0, lambda: self.status_var.set(f"Error loading model: {str(e)}"))
                 self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to load model: {str(e)}"))
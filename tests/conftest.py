@@ -0,0 +1,12 @@
+import pytest
+
+from bg_remover import SessionRegistry, SmartBgRemover
+from bg_remover_bench import StubSession
+
+
+@pytest.fixture
+def remover():
+    # The benchmark's stub session stands in for the model, so nothing is downloaded
+    remover = SmartBgRemover("u2netp", registry=SessionRegistry(loader=StubSession))
+    yield remover
+    remover.close()
@@ -0,0 +1,17 @@
+from PIL import Image
+
+
+def test_process_batch_returns_input_order(remover, tmp_path):
+    inputs = []
+    for i, size in enumerate([(400, 300), (32, 32), (200, 120), (64, 48)]):
+        path = tmp_path / f"img{i}.png"
+        Image.new("RGB", size, (40 * i, 120, 200)).save(path)
+        inputs.append(str(path))
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    # A repeated input gets one record per listing
+    inputs = [inputs[0], str(broken), *inputs[1:], inputs[2]]
+
+    results = remover.process_batch(inputs, output_dir=tmp_path / "out", max_workers=3)
+    assert [record["input"] for record in results] == inputs
+    assert [record["success"] for record in results] == [True, False, True, True, True, True]
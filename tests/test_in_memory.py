@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def _subject():
+    pixels = np.zeros((64, 64, 3), dtype=np.uint8)
+    pixels[16:48, 16:48] = (220, 40, 40)
+    return Image.fromarray(pixels, "RGB")
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"fast": True},
+    {"alpha_matting": True, "matting": "fast"},
+    {"fast": True, "alpha_matting": True, "matting": "fast"},
+])
+def test_remove_background_array_leaves_caller_image_unchanged(remover, options):
+    img = _subject()
+    before = img.tobytes()
+
+    result = remover.remove_background_array(img, **options)
+    assert result.shape == (64, 64, 4)
+    assert img.mode == "RGB"
+    assert img.tobytes() == before
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from bg_remover import _fast_matting_cutout
+
+
+def _scene(foreground, background, shift=3, blur=6, size=256, radius=80):
+    """A subject with a wavy edge, its true alpha and a soft, offset predicted mask."""
+    yy, xx = np.mgrid[:size, :size]
+    angle = np.arctan2(yy - size / 2, xx - size / 2)
+    distance = np.hypot(yy - size / 2, xx - size / 2) - (radius + 6 * np.sin(angle * 7))
+    truth = np.clip(0.5 - distance, 0, 1)
+    pixels = truth[..., None] * np.array(foreground) + (1 - truth[..., None]) * np.array(background)
+    img = Image.fromarray(pixels.astype(np.uint8), "RGB")
+    coarse = np.clip(0.5 - (distance - shift) / blur, 0, 1)
+    mask = Image.fromarray((coarse * 255 + 0.5).astype(np.uint8), "L")
+    return img, mask, truth
+
+
+@pytest.mark.parametrize("foreground, background", [
+    ((200, 30, 30), (30, 160, 40)),    # red on green: equal luminance, different colour
+    ((40, 40, 200), (220, 210, 40)),
+    ((140, 140, 140), (110, 110, 110)),
+])
+@pytest.mark.parametrize("shift, blur", [(0, 3), (3, 6), (6, 15), (-4, 10)])
+@pytest.mark.parametrize("erode_size", [0, 10])
+def test_fast_matting_does_not_degrade_mask(foreground, background, shift, blur, erode_size):
+    img, mask, truth = _scene(foreground, background, shift, blur)
+    cutout = _fast_matting_cutout(img, mask, 240, 10, erode_size)
+
+    raw_error = np.abs(np.asarray(mask) / 255 - truth).mean()
+    fast_error = np.abs(np.asarray(cutout)[..., 3] / 255 - truth).mean()
+    assert fast_error <= raw_error
+